@@ -0,0 +1,146 @@
+"""Semantic cache of /ask answers.
+
+Answers are cached per (document, retrieval mode) together with the
+embedding of the question they answer. A new question is answered from the
+cache when its embedding is within ANSWER_CACHE_THRESHOLD cosine similarity
+of a cached question, the entry is younger than ANSWER_CACHE_TTL and the
+document's chunks haven't changed since (files.chunks_version).
+"""
+
+import os
+import threading
+import time
+from typing import NamedTuple, Optional, Tuple
+import numpy as np
+from dotenv import load_dotenv
+from cache import LRUCache
+from metrics import ANSWER_CACHE_SAVED_SECONDS, CACHE_REQUESTS
+
+load_dotenv()
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+# Minimum cosine similarity between two questions to reuse an answer
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "86400"))
+# Answers kept across all documents, least recently used documents go first
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "10000"))
+# Answers kept per document and retrieval mode, oldest go first
+ANSWER_CACHE_PER_DOCUMENT = int(os.getenv("ANSWER_CACHE_PER_DOCUMENT", "256"))
+
+
+class _Answers(NamedTuple):
+    """Cached answers of one document, replaced as a whole on every change"""
+
+    version: int
+    vectors: np.ndarray  # unit-length question embeddings, one per row
+    answers: Tuple[str, ...]
+    created_at: np.ndarray
+    latencies: Tuple[float, ...]
+
+
+def _unit(embedding) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class AnswerCache:
+    def __init__(
+        self,
+        max_size: int = ANSWER_CACHE_SIZE,
+        ttl: float = ANSWER_CACHE_TTL,
+        threshold: float = ANSWER_CACHE_THRESHOLD,
+        per_document: int = ANSWER_CACHE_PER_DOCUMENT,
+    ):
+        self.ttl = ttl
+        self.threshold = threshold
+        self.per_document = per_document
+        self._documents = LRUCache(max_size, sizeof=lambda value: len(value.answers))
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+
+    def get(
+        self, document_id: int, mode: str, version: int, embedding: list
+    ) -> Optional[str]:
+        """The answer to the most similar cached question, if similar enough"""
+        answer, latency = None, 0.0
+        entries = self._documents.get((document_id, mode))
+        if entries is not None and entries.version == version:
+            similarity = entries.vectors @ _unit(embedding)
+            # Expired entries never match
+            similarity[entries.created_at < time.time() - self.ttl] = -1.0
+            best = int(np.argmax(similarity))
+            if similarity[best] >= self.threshold:
+                answer, latency = entries.answers[best], entries.latencies[best]
+
+        with self._lock:
+            if answer is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.saved_seconds += latency
+        CACHE_REQUESTS.labels(
+            cache="answers", result="miss" if answer is None else "hit"
+        ).inc()
+        if answer is not None:
+            ANSWER_CACHE_SAVED_SECONDS.inc(latency)
+        return answer
+
+    def set(
+        self,
+        document_id: int,
+        mode: str,
+        version: int,
+        embedding: list,
+        answer: str,
+        latency: float,
+    ) -> None:
+        """Cache an answer and the completion latency it saves on a hit"""
+        key = (document_id, mode)
+        with self._lock:
+            entries = self._documents.get(key)
+            now = time.time()
+            if entries is None or entries.version != version:
+                entries = _Answers(
+                    version,
+                    np.empty((0, len(embedding)), np.float32),
+                    (),
+                    np.empty(0),
+                    (),
+                )
+            # Drop expired entries, and the oldest ones beyond the limit
+            indices = np.flatnonzero(entries.created_at >= now - self.ttl)
+            indices = indices[max(0, len(indices) - self.per_document + 1) :]
+            self._documents.set(
+                key,
+                _Answers(
+                    version,
+                    np.vstack([entries.vectors[indices], _unit(embedding)]),
+                    tuple(entries.answers[i] for i in indices) + (answer,),
+                    np.append(entries.created_at[indices], now),
+                    tuple(entries.latencies[i] for i in indices) + (latency,),
+                ),
+            )
+
+    def clear(self) -> None:
+        self._documents.clear()
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "answers": self._documents.size,
+            "documents": len(self._documents),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate,
+            "saved_seconds": self.saved_seconds,
+        }
+
+
+answer_cache = AnswerCache()
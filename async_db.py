@@ -0,0 +1,75 @@
+"""Async database access for the API request path.
+
+The API handlers run on the event loop, so they use an asyncpg engine: a
+slow query only holds up its own request. Code written against the sync
+Session (retrieval, job_queue, ...) is run with AsyncSession.run_sync, which
+executes it without blocking the loop. The ingest workers and CLIs keep
+using the sync engine in db.py.
+"""
+
+import os
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from pgvector import Vector
+from dotenv import load_dotenv
+from db import database_url
+
+load_dotenv()
+
+# Defaults to DB_URL with the asyncpg driver
+ASYNC_DB_URL = os.getenv("ASYNC_DB_URL") or make_url(database_url).set(
+    drivername="postgresql+asyncpg"
+)
+# Connections kept open, and extra ones opened under load
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+# Seconds a request waits for a connection before failing
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Statements running longer are cancelled by the server, 0 disables this
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "30000"))
+
+async_engine = create_async_engine(
+    ASYNC_DB_URL,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_pre_ping=True,
+    connect_args={
+        "server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}
+    },
+)
+
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, autoflush=False, expire_on_commit=False
+)
+
+
+def _encode_vector(value) -> bytes:
+    # pgvector's SQLAlchemy type binds vectors as text
+    if isinstance(value, str):
+        value = Vector.from_text(value)
+    elif not isinstance(value, Vector):
+        value = Vector(value)
+    return value.to_binary()
+
+
+async def _register_vector(connection) -> None:
+    await connection.set_type_codec(
+        "vector",
+        encoder=_encode_vector,
+        decoder=Vector.from_binary,
+        format="binary",
+    )
+
+
+@event.listens_for(async_engine.sync_engine, "connect")
+def _on_connect(dbapi_connection, connection_record):
+    # Transfer vectors in binary rather than as text, which is much cheaper
+    # to decode for the chunk vectors loaded by retrieval
+    dbapi_connection.run_async(_register_vector)
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -1,77 +1,117 @@
 import os
-from openai import OpenAI
+from itertools import islice
+from typing import Callable, Optional, TYPE_CHECKING
 from sqlalchemy.orm import Session
-from db import FileChunk
-from nltk.tokenize import sent_tokenize
 from dotenv import load_dotenv
+from db import FileChunk, bump_chunks_version
+from embeddings import get_client
+from embedding_cache import embed_with_cache, evict, stats as cache_stats
+from chunker import TokenChunker, CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS
+from metrics import INGEST_STAGE_SECONDS, StageTimer, parser_label, size_bucket
 
-load_dotenv()
-
-
-endpoint = "https://models.inference.ai.azure.com"
-OPENAI_API_KEY = os.getenv("GITHUB_TOKEN")
-if not OPENAI_API_KEY:
-    raise ValueError("Token is not set in the environment variables.")
-
-model_name = "text-embedding-3-small"
+if TYPE_CHECKING:  # openai is slow to import, see embeddings.create_client
+    from openai import OpenAI
 
-client = OpenAI(base_url=endpoint, api_key=OPENAI_API_KEY)
+load_dotenv()
 
-# Make sure to run the nltk.sh script to download the necessary nltk data
+# Chunks embedded and committed at a time. A failure loses at most this many
+# embeddings, and the job's lease is renewed after each commit.
+INGEST_COMMIT_CHUNKS = int(os.getenv("INGEST_COMMIT_CHUNKS", "256"))
 
 
 class TextProcessor:
-    def __init__(self, db: Session, file_id: int, chunk_size: int = 2):
+    def __init__(
+        self,
+        db: Session,
+        file_id: int,
+        chunk_tokens: int = CHUNK_TOKENS,
+        overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+        embedding_client: Optional["OpenAI"] = None,
+        file_name: Optional[str] = None,
+    ):
         self.db = db
         self.file_id = file_id
-        self.chunk_size = chunk_size
+        self.file_name = file_name
+        self.chunker = TokenChunker(chunk_tokens, overlap_tokens)
+        self.embedding_client = embedding_client or get_client()
+
+    def chunk_and_embed(
+        self,
+        text: str,
+        start: int = 0,
+        checkpoint: Optional[Callable[[int], None]] = None,
+    ):
+        """Chunk, embed and store text.
 
-    def chunk_and_embed(self, text: str):
+        Chunks are committed every INGEST_COMMIT_CHUNKS chunks, so a failure
+        only loses the embeddings of the window in progress. The first start chunks are
+        skipped, as an earlier attempt committed them. checkpoint is called
+        with the number of chunks stored so far before each commit, in the
+        same transaction.
+        """
+        # Stage timings are labelled by parser type and text size (in
+        # characters, which is close enough to bytes for the size buckets)
+        timer = StageTimer(
+            INGEST_STAGE_SECONDS,
+            parser=parser_label(self.file_name),
+            size=size_bucket(len(text)),
+        )
         try:
-            # Split text into sentences
-            try:
-                sentences = sent_tokenize(text)
-                print(f"Successfully tokenized {len(sentences)} sentences")
-            except Exception as e:
-                print(f"Error tokenizing sentences: {e}")
-                raise
+            # Chunks are generated lazily and fed straight into the
+            # embedding stage, which pulls them a window at a time
+            chunks = timer.iter(
+                "chunk", islice(self.chunker.chunks(text, timer), start, None)
+            )
 
-            # Chunk sentences
+            # Embed chunks in batches, reusing cached embeddings, and store
+            # them in chunk order
+            processed = committed = start
             try:
-                chunks = [
-                    " ".join(sentences[i : i + self.chunk_size])
-                    for i in range(0, len(sentences), self.chunk_size)
-                ]
-                print(f"Successfully chunked into {len(chunks)} chunks")
+                for batch, embeddings in timer.iter(
+                    "embed",
+                    embed_with_cache(
+                        self.db,
+                        chunks,
+                        self.embedding_client,
+                        window_size=INGEST_COMMIT_CHUNKS,
+                    ),
+                ):
+                    with timer.stage("insert"):
+                        self.db.add_all(
+                            FileChunk(
+                                file_id=self.file_id,
+                                chunk_text=chunk,
+                                embedding_vector=embedding,
+                            )
+                            for chunk, embedding in zip(batch, embeddings)
+                        )
+                        processed += len(batch)
+                        self._commit(processed, checkpoint)
+                    committed = processed
+                    print(f"Successfully committed {processed} chunks")
             except Exception as e:
-                print(f"Error chunking sentences: {e}")
+                print(f"Error processing chunks after {committed} committed: {e}")
+                self.db.rollback()
                 raise
-
-            for chunk in chunks:
-                try:
-                    # Create embeddings
-                    response = client.embeddings.create(input=chunk, model=model_name)
-                    embeddings = response.data[0].embedding
-
-                    # Store chunk and embedding in database
-                    file_chunk = FileChunk(
-                        file_id=self.file_id,
-                        chunk_text=chunk,
-                        embedding_vector=embeddings,
-                    )
-                    self.db.add(file_chunk)
-                    print(f"Successfully processed chunk: {chunk[:50]}...")
-                except Exception as e:
-                    print(f"Error processing chunk: {e}")
-                    raise
+            timer.observe()
 
             try:
+                evicted = evict(self.db)
                 self.db.commit()
-                print("Successfully committed to database")
+                print(
+                    f"Embedding cache: {cache_stats.hits} hits, "
+                    f"{cache_stats.misses} misses, {evicted} evicted"
+                )
             except Exception as e:
-                print(f"Error committing to database: {e}")
+                # The cache is an optimisation, don't fail the ingest over it
+                print(f"Error evicting embedding cache entries: {e}")
                 self.db.rollback()
-                raise
         except Exception as e:
             print(f"Fatal error in chunk_and_embed: {e}")
             raise
+
+    def _commit(self, processed: int, checkpoint) -> None:
+        if checkpoint is not None:
+            checkpoint(processed)
+        bump_chunks_version(self.db, self.file_id)
+        self.db.commit()
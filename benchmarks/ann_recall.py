@@ -0,0 +1,117 @@
+"""Recall@k vs. latency report for the embedding index against exact search.
+
+Query vectors are sampled from the stored chunk embeddings. For every value of
+the recall knob (hnsw.ef_search or ivfflat.probes, depending on
+VECTOR_INDEX_TYPE) the index results are compared with an exact scan.
+
+Usage:
+    python -m benchmarks.ann_recall --k 10 --queries 200 --values 10 20 40 80 160
+"""
+
+import argparse
+import json
+import statistics
+import time
+from sqlalchemy import select, func, text
+from benchmarks.common import percentile
+from retrieval import ITERATIVE_SCAN
+from db import (
+    SessionLocal,
+    FileChunk,
+    VECTOR_INDEX_TYPE,
+    vector_distance,
+    set_search_params,
+)
+
+
+def _search(db, vector, k, file_id=None):
+    query = select(FileChunk.chunk_id)
+    if file_id is not None:
+        query = query.where(FileChunk.file_id == file_id)
+    query = query.order_by(vector_distance(FileChunk.embedding_vector, vector)).limit(k)
+    start = time.perf_counter()
+    ids = db.scalars(query).all()
+    return ids, time.perf_counter() - start
+
+
+def run(k, num_queries, values, per_file):
+    db = SessionLocal()
+    try:
+        samples = db.execute(
+            select(FileChunk.file_id, FileChunk.embedding_vector)
+            .order_by(func.random())
+            .limit(num_queries)
+        ).all()
+
+        # Ground truth from an exact scan with index scans disabled
+        truth, exact_latencies = [], []
+        for file_id, vector in samples:
+            db.execute(text("SET LOCAL enable_indexscan = off"))
+            ids, elapsed = _search(db, vector, k, file_id if per_file else None)
+            db.rollback()
+            truth.append(set(ids))
+            exact_latencies.append(elapsed)
+
+        results = [
+            {
+                "setting": "exact",
+                "recall": 1.0,
+                "p50_ms": percentile(exact_latencies, 50) * 1000,
+                "p95_ms": percentile(exact_latencies, 95) * 1000,
+            }
+        ]
+        knob = "ef_search" if VECTOR_INDEX_TYPE == "hnsw" else "probes"
+        for value in values:
+            recalls, latencies = [], []
+            for (file_id, vector), expected in zip(samples, truth):
+                # /ask filters by file with an iterative scan
+                iterative_scan = ITERATIVE_SCAN if per_file else None
+                set_search_params(db, iterative_scan=iterative_scan, **{knob: value})
+                ids, elapsed = _search(db, vector, k, file_id if per_file else None)
+                db.rollback()
+                recalls.append(len(expected & set(ids)) / max(len(expected), 1))
+                latencies.append(elapsed)
+            results.append(
+                {
+                    "setting": f"{knob}={value}",
+                    "recall": statistics.mean(recalls),
+                    "p50_ms": percentile(latencies, 50) * 1000,
+                    "p95_ms": percentile(latencies, 95) * 1000,
+                }
+            )
+        return results
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--values", type=int, nargs="+", default=[10, 20, 40, 80, 160])
+    parser.add_argument(
+        "--per-file",
+        action="store_true",
+        help="filter by the query chunk's file_id, as /ask does",
+    )
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    if VECTOR_INDEX_TYPE == "none":
+        raise SystemExit("VECTOR_INDEX_TYPE is none, nothing to compare")
+
+    results = run(args.k, args.queries, args.values, args.per_file)
+
+    print(f"{'setting':<16}{'recall@' + str(args.k):>12}{'p50 ms':>10}{'p95 ms':>10}")
+    for row in results:
+        print(
+            f"{row['setting']:<16}{row['recall']:>12.3f}"
+            f"{row['p50_ms']:>10.2f}{row['p95_ms']:>10.2f}"
+        )
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"k": args.k, "index": VECTOR_INDEX_TYPE, "results": results}, f)
+
+
+if __name__ == "__main__":
+    main()
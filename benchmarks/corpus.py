@@ -0,0 +1,195 @@
+"""Generate a synthetic benchmark corpus of txt, md, docx, pdf and png files.
+
+Documents are built from random prose with embedded facts (part numbers
+and error codes). An eval.jsonl file lists one question per fact with the
+text that answers it, for the retrieval and /ask benchmarks.
+
+Usage:
+    python -m benchmarks.corpus bench_corpus --docs-per-type 20 --paragraphs 60
+"""
+
+import argparse
+import json
+import os
+import random
+import docx
+import fitz
+from PIL import Image, ImageDraw
+
+FILE_TYPES = ("txt", "md", "docx", "pdf", "png")
+
+_WORDS = (
+    "system module valve sensor pressure controller firmware update network "
+    "latency cache index storage request response thread process memory "
+    "battery voltage signal operator manual warranty install configure "
+    "replace inspect calibrate monitor report schedule maintenance safety"
+).split()
+
+
+def _sentence(rng: random.Random) -> str:
+    words = rng.choices(_WORDS, k=rng.randint(8, 20))
+    return " ".join(words).capitalize() + "."
+
+
+def _paragraph(rng: random.Random) -> str:
+    return " ".join(_sentence(rng) for _ in range(rng.randint(3, 7)))
+
+
+def _fact(rng: random.Random, doc_index: int, fact_index: int):
+    component = f"{rng.choice(_WORDS)}-{doc_index}-{fact_index}"
+    if rng.random() < 0.5:
+        answer = f"PN-{rng.randint(10000, 99999)}"
+        text = f"The part number for component {component} is {answer}."
+        question = f"What is the part number for component {component}?"
+    else:
+        answer = f"E{rng.randint(1000, 9999)}"
+        text = f"Error code {answer} is raised when component {component} fails."
+        question = f"Which error code is raised when component {component} fails?"
+    return text, question, answer
+
+
+def build_document(rng: random.Random, doc_index: int, paragraphs: int, facts: int):
+    body = [_paragraph(rng) for _ in range(paragraphs)]
+    questions = []
+    for fact_index in range(facts):
+        text, question, answer = _fact(rng, doc_index, fact_index)
+        position = rng.randrange(len(body))
+        body[position] = f"{body[position]} {text}"
+        questions.append({"question": question, "expected": answer})
+    return body, questions
+
+
+def write_txt(path, body):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n\n".join(body))
+
+
+def write_md(path, body):
+    lines = []
+    for i, paragraph in enumerate(body):
+        if i % 10 == 0:
+            lines.append(f"## Section {i // 10 + 1}\n")
+        lines.append(paragraph + "\n")
+    lines.append("| key | value |\n| --- | --- |\n| sections | %d |\n" % len(body))
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines))
+
+
+def write_docx(path, body):
+    document = docx.Document()
+    for i, paragraph in enumerate(body):
+        if i % 10 == 0:
+            document.add_heading(f"Section {i // 10 + 1}", level=2)
+        document.add_paragraph(paragraph)
+    table = document.add_table(rows=2, cols=2)
+    table.cell(0, 0).text, table.cell(0, 1).text = "key", "value"
+    table.cell(1, 0).text, table.cell(1, 1).text = "sections", str(len(body))
+    document.save(path)
+
+
+def write_pdf(path, body, scanned_fraction: float, rng: random.Random):
+    document = fitz.open()
+    per_page = 4
+    for start in range(0, len(body), per_page):
+        page = document.new_page()
+        text = "\n\n".join(body[start : start + per_page])
+        page.insert_textbox(page.rect + (50, 50, -50, -50), text, fontsize=10)
+        if rng.random() < scanned_fraction:
+            # Replace the page with an image of itself, as a scanner would
+            pix = page.get_pixmap(dpi=150)
+            document.delete_page(-1)
+            scanned = document.new_page()
+            scanned.insert_image(scanned.rect, pixmap=pix)
+    document.save(path)
+    document.close()
+
+
+def write_png(path, body):
+    text = "\n".join(body[:6])
+    lines = []
+    for paragraph in text.split("\n"):
+        words, line = paragraph.split(), ""
+        for word in words:
+            if len(line) + len(word) > 90:
+                lines.append(line)
+                line = ""
+            line += word + " "
+        lines.append(line)
+    image = Image.new("RGB", (1400, 24 * len(lines) + 40), "white")
+    draw = ImageDraw.Draw(image)
+    for i, line in enumerate(lines):
+        draw.text((20, 20 + 24 * i), line, fill="black")
+    image.save(path)
+
+
+def generate(
+    output: str,
+    docs_per_type: int,
+    paragraphs: int,
+    facts: int,
+    scanned_fraction: float,
+    seed: int,
+):
+    rng = random.Random(seed)
+    docs_dir = os.path.join(output, "docs")
+    os.makedirs(docs_dir, exist_ok=True)
+    eval_set = []
+    doc_index = 0
+    for file_type in FILE_TYPES:
+        for i in range(docs_per_type):
+            # Images hold much less text than the other formats
+            doc_paragraphs = 6 if file_type == "png" else paragraphs
+            body, questions = build_document(rng, doc_index, doc_paragraphs, facts)
+            if file_type == "png":
+                questions = [
+                    q for q in questions if q["expected"] in " ".join(body[:6])
+                ]
+            file_name = f"doc_{doc_index:04d}.{file_type}"
+            path = os.path.join(docs_dir, file_name)
+            if file_type == "txt":
+                write_txt(path, body)
+            elif file_type == "md":
+                write_md(path, body)
+            elif file_type == "docx":
+                write_docx(path, body)
+            elif file_type == "pdf":
+                write_pdf(path, body, scanned_fraction, rng)
+            else:
+                write_png(path, body)
+            eval_set.extend({"file_name": file_name, **q} for q in questions)
+            doc_index += 1
+
+    with open(os.path.join(output, "eval.jsonl"), "w") as f:
+        for example in eval_set:
+            f.write(json.dumps(example) + "\n")
+    return docs_dir, len(eval_set)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("output", help="directory to write the corpus to")
+    parser.add_argument("--docs-per-type", type=int, default=10)
+    parser.add_argument("--paragraphs", type=int, default=60)
+    parser.add_argument("--facts", type=int, default=5)
+    parser.add_argument(
+        "--scanned-fraction",
+        type=float,
+        default=0.2,
+        help="fraction of PDF pages stored as images only",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    docs_dir, questions = generate(
+        args.output,
+        args.docs_per_type,
+        args.paragraphs,
+        args.facts,
+        args.scanned_fraction,
+        args.seed,
+    )
+    print(f"Wrote corpus to {docs_dir} and {questions} questions to eval.jsonl")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+"""Local stand-ins for the embeddings and chat completion APIs.
+
+Serves an OpenAI-compatible POST /embeddings and an Azure AI Inference
+compatible POST /chat/completions (optionally streamed), with configurable
+latency and a requests-per-second limit that answers 429 with Retry-After
+and x-ratelimit-* headers like the real services.
+
+Chat latency grows with the prompt length (prefill), and GET /stats reports
+the chat requests and prompt tokens served so far.
+
+Embeddings are deterministic hashed bag-of-words vectors, so texts sharing
+words are close to each other and retrieval results are meaningful.
+
+Usage:
+    python -m benchmarks.fake_services --port 8001 --embedding-latency-ms 40
+    EMBEDDING_ENDPOINT=http://127.0.0.1:8001 CHAT_ENDPOINT=http://127.0.0.1:8001 ...
+"""
+
+import argparse
+import asyncio
+import json
+import re
+import time
+import uuid
+import zlib
+from functools import lru_cache
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+DIMENSIONS = 1536
+_WORD = re.compile(r"\w+")
+
+
+class Settings:
+    embedding_latency_ms = 40.0
+    embedding_latency_per_input_ms = 0.2
+    chat_first_token_ms = 300.0
+    chat_prompt_token_ms = 0.05
+    chat_token_ms = 15.0
+    chat_tokens = 120
+    requests_per_second = 0.0  # 0 disables rate limiting
+
+
+settings = Settings()
+
+
+class RateLimiter:
+    """Fixed one-second window limiter shared by both endpoints"""
+
+    def __init__(self):
+        self.window = int(time.time())
+        self.count = 0
+
+    def check(self):
+        limit = settings.requests_per_second
+        if not limit:
+            return None
+        now = time.time()
+        if int(now) != self.window:
+            self.window, self.count = int(now), 0
+        self.count += 1
+        remaining = max(0, int(limit) - self.count)
+        headers = {
+            "x-ratelimit-limit-requests": str(int(limit)),
+            "x-ratelimit-remaining-requests": str(remaining),
+        }
+        if self.count > limit:
+            headers["retry-after"] = f"{1 - (now - int(now)):.3f}"
+            return JSONResponse(
+                {"error": {"code": "429", "message": "Rate limit exceeded"}},
+                status_code=429,
+                headers=headers,
+            )
+        return headers
+
+
+limiter = RateLimiter()
+app = FastAPI()
+usage = {"chat_requests": 0, "prompt_tokens": 0}
+
+
+@lru_cache(maxsize=200000)
+def _word_vector(word: str) -> np.ndarray:
+    rng = np.random.default_rng(zlib.crc32(word.encode("utf-8")))
+    return rng.standard_normal(DIMENSIONS).astype(np.float32)
+
+
+def fake_embedding(text: str) -> list:
+    vector = np.zeros(DIMENSIONS, dtype=np.float32)
+    for word in _WORD.findall(text.lower()):
+        vector += _word_vector(word)
+    norm = np.linalg.norm(vector)
+    if norm:
+        vector /= norm
+    return vector.tolist()
+
+
+@app.post("/embeddings")
+async def embeddings(request: Request):
+    limited = limiter.check()
+    if isinstance(limited, JSONResponse):
+        return limited
+    body = await request.json()
+    inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+    await asyncio.sleep(
+        (
+            settings.embedding_latency_ms
+            + settings.embedding_latency_per_input_ms * len(inputs)
+        )
+        / 1000
+    )
+    data = [
+        {"object": "embedding", "index": i, "embedding": fake_embedding(text)}
+        for i, text in enumerate(inputs)
+    ]
+    tokens = sum(len(text) // 4 + 1 for text in inputs)
+    return JSONResponse(
+        {
+            "object": "list",
+            "data": data,
+            "model": body.get("model"),
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        },
+        headers=limited or {},
+    )
+
+
+def _completion_tokens():
+    return [f"token{i} " for i in range(settings.chat_tokens)]
+
+
+@app.post("/chat/completions")
+async def chat_completions(request: Request):
+    limited = limiter.check()
+    if isinstance(limited, JSONResponse):
+        return limited
+    body = await request.json()
+    completion_id = str(uuid.uuid4())
+    created = int(time.time())
+    prompt_tokens = sum(len(m.get("content", "")) // 4 for m in body["messages"])
+    usage["chat_requests"] += 1
+    usage["prompt_tokens"] += prompt_tokens
+    first_token_ms = (
+        settings.chat_first_token_ms + settings.chat_prompt_token_ms * prompt_tokens
+    )
+
+    if body.get("stream"):
+
+        async def events():
+            await asyncio.sleep(first_token_ms / 1000)
+            for token in _completion_tokens():
+                chunk = {
+                    "id": completion_id,
+                    "created": created,
+                    "model": body.get("model"),
+                    "choices": [
+                        {"index": 0, "delta": {"content": token}, "finish_reason": None}
+                    ],
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+                await asyncio.sleep(settings.chat_token_ms / 1000)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(
+            events(), media_type="text/event-stream", headers=limited or {}
+        )
+
+    await asyncio.sleep(
+        (first_token_ms + settings.chat_token_ms * settings.chat_tokens) / 1000
+    )
+    return JSONResponse(
+        {
+            "id": completion_id,
+            "created": created,
+            "model": body.get("model"),
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {
+                        "role": "assistant",
+                        "content": "".join(_completion_tokens()),
+                    },
+                    "finish_reason": "stop",
+                }
+            ],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": settings.chat_tokens,
+                "total_tokens": prompt_tokens + settings.chat_tokens,
+            },
+        },
+        headers=limited or {},
+    )
+
+
+@app.get("/stats")
+async def stats():
+    return usage
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--embedding-latency-ms", type=float, default=40.0)
+    parser.add_argument("--embedding-latency-per-input-ms", type=float, default=0.2)
+    parser.add_argument("--chat-first-token-ms", type=float, default=300.0)
+    parser.add_argument("--chat-prompt-token-ms", type=float, default=0.05)
+    parser.add_argument("--chat-token-ms", type=float, default=15.0)
+    parser.add_argument("--chat-tokens", type=int, default=120)
+    parser.add_argument(
+        "--requests-per-second", type=float, default=0.0, help="0 disables the limit"
+    )
+    args = parser.parse_args()
+
+    settings.embedding_latency_ms = args.embedding_latency_ms
+    settings.embedding_latency_per_input_ms = args.embedding_latency_per_input_ms
+    settings.chat_first_token_ms = args.chat_first_token_ms
+    settings.chat_prompt_token_ms = args.chat_prompt_token_ms
+    settings.chat_token_ms = args.chat_token_ms
+    settings.chat_tokens = args.chat_tokens
+    settings.requests_per_second = args.requests_per_second
+
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""Measure application cold start.
+
+Reports, as the median of several fresh processes:
+    - the time to import main (API) and worker (ingest workers)
+    - the time from launching uvicorn to the first successful request
+    - the slowest imports of main, from python -X importtime
+
+No database connection is needed: the engine connects lazily and schema
+bootstrap is a separate step (python db.py).
+
+Usage:
+    python -m benchmarks.startup --runs 5 --json startup.json
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+import httpx
+
+PORT = 8003
+
+
+def _env() -> dict:
+    env = dict(os.environ)
+    env.setdefault("DB_URL", "postgresql+psycopg2://localhost/startup_benchmark")
+    env.setdefault("GITHUB_TOKEN", "benchmark")
+    return env
+
+
+def import_seconds(module: str) -> float:
+    code = (
+        "import time; start = time.perf_counter(); "
+        f"import {module}; print(time.perf_counter() - start)"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        env=_env(),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def first_request_seconds(path: str = "/cache/stats", timeout: float = 60.0) -> float:
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "main:app",
+            "--port",
+            str(PORT),
+            "--log-level",
+            "warning",
+        ],
+        env=_env(),
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                if httpx.get(f"http://127.0.0.1:{PORT}{path}").status_code == 200:
+                    return time.perf_counter() - start
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.01)
+        raise RuntimeError(f"No response from the API within {timeout}s")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def slowest_imports(module: str, count: int = 15):
+    """Top-level packages imported by module, by cumulative import time"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        env=_env(),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    pattern = re.compile(r"import time:\s+\d+ \|\s+(\d+) \|( *)(\S+)")
+    totals = {}
+    for line in result.stderr.splitlines():
+        match = pattern.match(line)
+        # Only packages imported directly by the application modules
+        if match and len(match.group(2)) <= 3:
+            totals[match.group(3)] = int(match.group(1)) / 1e6
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    results = {
+        "import_main_s": statistics.median(
+            import_seconds("main") for _ in range(args.runs)
+        ),
+        "import_worker_s": statistics.median(
+            import_seconds("worker") for _ in range(args.runs)
+        ),
+        "first_request_s": statistics.median(
+            first_request_seconds() for _ in range(args.runs)
+        ),
+        "slowest_imports_main": slowest_imports("main"),
+    }
+
+    print(f"import main:    {results['import_main_s'] * 1000:8.1f} ms")
+    print(f"import worker:  {results['import_worker_s'] * 1000:8.1f} ms")
+    print(f"first request:  {results['first_request_s'] * 1000:8.1f} ms")
+    print("slowest imports of main (cumulative):")
+    for name, seconds in results["slowest_imports_main"]:
+        print(f"  {name:<40}{seconds * 1000:8.1f} ms")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
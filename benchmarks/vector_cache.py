@@ -0,0 +1,111 @@
+"""Latency of vector retrieval from Postgres vs. the in-process vector cache.
+
+Takes the documents with the most chunks and, for query vectors sampled
+from their stored chunks, times retrieval.vector_search against
+VectorCache.search on the loaded document. Also reports how long a document
+takes to load, its size in memory and the recall of the database search
+against the cache's exact results.
+
+Usage:
+    python -m benchmarks.vector_cache --documents 5 --queries 100 --k 30
+"""
+
+import argparse
+import json
+import statistics
+import time
+from sqlalchemy import select, func
+from benchmarks.common import percentile
+from db import SessionLocal, FileChunk
+from retrieval import vector_search
+from vector_cache import load_document
+
+
+def _timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def run(num_documents, num_queries, k):
+    db = SessionLocal()
+    try:
+        documents = db.execute(
+            select(FileChunk.file_id, func.count().label("chunks"))
+            .group_by(FileChunk.file_id)
+            .order_by(func.count().desc())
+            .limit(num_documents)
+        ).all()
+
+        results = []
+        for file_id, chunks in documents:
+            document, load_seconds = _timed(load_document, db, file_id)
+            db.rollback()
+            if document is None:
+                print(f"Skipping file {file_id}, too many chunks to cache")
+                continue
+            queries = db.scalars(
+                select(FileChunk.embedding_vector)
+                .where(FileChunk.file_id == file_id)
+                .order_by(func.random())
+                .limit(num_queries)
+            ).all()
+            db.rollback()
+
+            db_latencies, cache_latencies, recalls = [], [], []
+            for vector in queries:
+                rows, elapsed = _timed(vector_search, db, file_id, vector, limit=k)
+                db.rollback()
+                db_latencies.append(elapsed)
+                (cached,), elapsed = _timed(document.search, [vector], k)
+                cache_latencies.append(elapsed)
+                expected = {chunk.chunk_id for chunk in cached}
+                found = {row.chunk_id for row in rows}
+                recalls.append(len(expected & found) / max(len(expected), 1))
+
+            results.append(
+                {
+                    "file_id": file_id,
+                    "chunks": chunks,
+                    "load_ms": load_seconds * 1000,
+                    "cache_bytes": document.nbytes,
+                    "db_p50_ms": percentile(db_latencies, 50) * 1000,
+                    "db_p95_ms": percentile(db_latencies, 95) * 1000,
+                    "cache_p50_ms": percentile(cache_latencies, 50) * 1000,
+                    "cache_p95_ms": percentile(cache_latencies, 95) * 1000,
+                    "db_recall": statistics.mean(recalls),
+                }
+            )
+        return results
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--documents", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=30, help="as CONTEXT_CANDIDATES")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    results = run(args.documents, args.queries, args.k)
+
+    print(
+        f"{'file':>8}{'chunks':>8}{'load ms':>10}{'MB':>8}{'db p50':>10}"
+        f"{'db p95':>10}{'cache p50':>11}{'cache p95':>11}{'recall':>8}"
+    )
+    for row in results:
+        print(
+            f"{row['file_id']:>8}{row['chunks']:>8}{row['load_ms']:>10.1f}"
+            f"{row['cache_bytes'] / 1024**2:>8.1f}{row['db_p50_ms']:>10.2f}"
+            f"{row['db_p95_ms']:>10.2f}{row['cache_p50_ms']:>11.3f}"
+            f"{row['cache_p95_ms']:>11.3f}{row['db_recall']:>8.3f}"
+        )
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"k": args.k, "results": results}, f)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""Index size, latency and recall@k for full, halfvec and binary vector storage.
+
+For each storage mode an HNSW index is built over the current file_chunks
+inside a transaction, queried, and rolled back, so the database is left as
+it was. Compact indexes are queried for k * factor candidates which are
+re-ranked with the full-precision vectors, as retrieval.nearest_chunks does.
+Recall is measured against an exact scan.
+
+Building the indexes takes a while on large tables and holds a lock that
+blocks writes to file_chunks, so run it against a copy of production data.
+
+Usage:
+    python -m benchmarks.vector_storage --k 10 --queries 100 --factors 1 2 4 10
+
+50,000 synthetic 1536-dimension chunks (normalised, in 50 clusters), l2,
+m=16, ef_construction=64, ef_search=40, Postgres 16, pgvector 0.8.5, 1 vCPU:
+
+    storage     factor  index MB   B/row  recall@10   p50 ms   p95 ms
+    full             1     390.6    8192      0.972     4.75     5.47
+    halfvec          1     195.3    4096      0.928     3.53     5.14
+    halfvec         10     195.3    4096      0.952     4.67     5.78
+    binary           1      23.9     502      0.205     4.31     7.04
+    binary           4      23.9     502      0.377     3.36     4.65
+    binary          10      23.9     502      0.541     5.60     7.34
+
+halfvec halves the index at little cost in recall, and re-ranking 10x the
+candidates recovers most of it. Binary recall on random vectors is a floor; measure it on real
+embeddings before enabling it.
+"""
+
+import argparse
+import json
+import statistics
+import time
+from sqlalchemy import select, func, text
+from benchmarks.common import percentile
+from db import (
+    SessionLocal,
+    FileChunk,
+    VECTOR_DISTANCE,
+    VECTOR_OPS,
+    HALFVEC_OPS,
+    HNSW_M,
+    HNSW_EF_CONSTRUCTION,
+    EMBEDDING_DIMENSIONS,
+)
+
+OPERATORS = {"l2": "<->", "cosine": "<=>", "inner_product": "<#>"}
+
+# (index key, ordering expression for the query vector :q) per storage mode
+_op = OPERATORS[VECTOR_DISTANCE]
+_halfvec = f"halfvec({EMBEDDING_DIMENSIONS})"
+_bits = f"bit({EMBEDDING_DIMENSIONS})"
+MODES = {
+    "full": (
+        f"embedding_vector {VECTOR_OPS[VECTOR_DISTANCE]}",
+        f"embedding_vector {_op} CAST(:q AS vector)",
+    ),
+    "halfvec": (
+        f"(embedding_vector::{_halfvec}) {HALFVEC_OPS[VECTOR_DISTANCE]}",
+        f"embedding_vector::{_halfvec} {_op} CAST(:q AS {_halfvec})",
+    ),
+    "binary": (
+        f"(binary_quantize(embedding_vector)::{_bits}) bit_hamming_ops",
+        f"binary_quantize(embedding_vector)::{_bits} <~> "
+        f"binary_quantize(CAST(:q AS vector))::{_bits}",
+    ),
+}
+
+
+def _search(db, order_by, vector, k, fetch):
+    query = text(
+        f"SELECT chunk_id FROM ("
+        f"  SELECT chunk_id, embedding_vector FROM file_chunks"
+        f"  ORDER BY {order_by} LIMIT :fetch"
+        f") candidates ORDER BY embedding_vector {_op} CAST(:q AS vector) LIMIT :k"
+    )
+    start = time.perf_counter()
+    ids = db.scalars(query, {"q": str(vector), "fetch": fetch, "k": k}).all()
+    return ids, time.perf_counter() - start
+
+
+def run(k, num_queries, factors, ef_search):
+    db = SessionLocal()
+    try:
+        rows = db.scalar(select(func.count()).select_from(FileChunk))
+        samples = db.scalars(
+            select(FileChunk.embedding_vector)
+            .order_by(func.random())
+            .limit(num_queries)
+        ).all()
+        samples = [list(map(float, vector)) for vector in samples]
+
+        # Ground truth from an exact scan with index scans disabled
+        db.execute(text("SET LOCAL enable_indexscan = off"))
+        exact_order = f"embedding_vector {_op} CAST(:q AS vector)"
+        truth = [set(_search(db, exact_order, v, k, k)[0]) for v in samples]
+        db.rollback()
+
+        results = []
+        for mode, (key, order_by) in MODES.items():
+            print(f"Building {mode} index over {rows} rows")
+            start = time.perf_counter()
+            db.execute(
+                text(
+                    f"CREATE INDEX bench_vector_storage ON file_chunks "
+                    f"USING hnsw ({key}) "
+                    f"WITH (m = {HNSW_M}, ef_construction = {HNSW_EF_CONSTRUCTION})"
+                )
+            )
+            build_seconds = time.perf_counter() - start
+            index_bytes = db.scalar(
+                text("SELECT pg_relation_size('bench_vector_storage')")
+            )
+            # Only the benchmark index may serve the queries
+            db.execute(text("SET LOCAL enable_seqscan = off"))
+
+            for factor in [1] if mode == "full" else factors:
+                fetch = k * factor
+                db.execute(
+                    text("SELECT set_config('hnsw.ef_search', :value, true)"),
+                    {"value": str(min(1000, max(ef_search, fetch)))},
+                )
+                recalls, latencies = [], []
+                for vector, expected in zip(samples, truth):
+                    ids, elapsed = _search(db, order_by, vector, k, fetch)
+                    recalls.append(len(expected & set(ids)) / max(len(expected), 1))
+                    latencies.append(elapsed)
+                results.append(
+                    {
+                        "storage": mode,
+                        "rerank_factor": factor,
+                        "index_mb": index_bytes / 1024 / 1024,
+                        "index_bytes_per_row": index_bytes / max(rows, 1),
+                        "build_s": build_seconds,
+                        "recall": statistics.mean(recalls),
+                        "p50_ms": percentile(latencies, 50) * 1000,
+                        "p95_ms": percentile(latencies, 95) * 1000,
+                    }
+                )
+            # Drops the index
+            db.rollback()
+        return rows, results
+    finally:
+        db.rollback()
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--factors", type=int, nargs="+", default=[1, 2, 4, 10])
+    parser.add_argument("--ef-search", type=int, default=40)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    rows, results = run(args.k, args.queries, args.factors, args.ef_search)
+
+    print(
+        f"{'storage':<10}{'factor':>8}{'index MB':>10}{'B/row':>8}"
+        f"{'recall@' + str(args.k):>11}{'p50 ms':>9}{'p95 ms':>9}"
+    )
+    for row in results:
+        print(
+            f"{row['storage']:<10}{row['rerank_factor']:>8}{row['index_mb']:>10.1f}"
+            f"{row['index_bytes_per_row']:>8.0f}{row['recall']:>11.3f}"
+            f"{row['p50_ms']:>9.2f}{row['p95_ms']:>9.2f}"
+        )
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"k": args.k, "rows": rows, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,343 @@
+"""Bulk ingestion of a directory of documents.
+
+Walks a directory and parses and chunks the new files in a process pool. The
+chunks of a batch of documents are embedded together (through the embedding
+cache) and the files and file_chunks rows are written with binary COPY, one
+transaction per batch. A file whose content hash is already in the files
+table is skipped, so an interrupted load resumes when run again.
+
+With --defer-indexes the embedding, full-text and file_id indexes of
+file_chunks are dropped for the load and built once at the end. The default,
+auto, does this when file_chunks is empty, i.e. for a backfill into a new
+database, or when indexes are missing, e.g. after a load that was killed.
+Missing indexes are built at the end of every run. Raise maintenance_work_mem
+on the server to speed up the build, and consider EMBEDDING_CACHE_ENABLED=false
+for archives without duplicate text.
+
+Usage:
+    python bulk_ingest.py /path/to/archive --workers 8 --batch-size 64
+"""
+
+import argparse
+import hashlib
+import io
+import multiprocessing
+import os
+import struct
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import islice
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Set
+from sqlalchemy import select, text
+from sqlalchemy.orm import Session
+from pgvector import Vector
+from dotenv import load_dotenv
+from db import (
+    SessionLocal,
+    engine,
+    init_db,
+    ensure_vector_index,
+    vector_index_name,
+    VECTOR_INDEX_TYPE,
+    File,
+    FileChunk,
+    SCHEMA_UPGRADES,
+    DB_INIT_ON_STARTUP,
+)
+from file_parser import FileParser, ParserFactory
+from parsers import ocr_budget
+from chunker import TokenChunker
+from embedding_cache import embed_with_cache, evict
+from uploads import UPLOAD_CHUNK_SIZE
+
+load_dotenv()
+
+BULK_INGEST_WORKERS = int(os.getenv("BULK_INGEST_WORKERS", str(os.cpu_count() or 1)))
+# Documents written per transaction
+BULK_INGEST_BATCH_SIZE = int(os.getenv("BULK_INGEST_BATCH_SIZE", "64"))
+# Content hashes looked up in the files table per query
+HASH_LOOKUP_SIZE = 1000
+
+# Indexes of file_chunks dropped by --defer-indexes, besides the embedding
+# index. SCHEMA_UPGRADES creates them again.
+DEFERRED_INDEXES = ("ix_file_chunks_file_id", "ix_file_chunks_chunk_tsv")
+
+_COPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0)
+_COPY_TRAILER = struct.pack(">h", -1)
+
+
+class ParsedFile(NamedTuple):
+    path: str
+    content_hash: str
+    text: Optional[str]
+    chunks: List[str]
+    error: Optional[str]
+
+
+def iter_paths(root: str) -> Iterator[str]:
+    """Files under root with a registered parser, in a stable order"""
+    for directory, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if name.split(".")[-1] in ParserFactory._parsers:
+                yield os.path.join(directory, name)
+
+
+def _batches(items: Iterable, size: int) -> Iterator[list]:
+    items = iter(items)
+    while batch := list(islice(items, size)):
+        yield batch
+
+
+def file_hash(path: str) -> str:
+    """SHA-256 of the file, as computed by uploads.save_stream"""
+    hasher = hashlib.sha256()
+    with open(path, "rb") as file_object:
+        while block := file_object.read(UPLOAD_CHUNK_SIZE):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+# Created once per pool process by _init_process
+_chunker: Optional[TokenChunker] = None
+
+
+def _init_process(ocr_workers) -> None:
+    global _chunker
+    ocr_budget.use(ocr_workers)
+    ParserFactory.preload()
+    _chunker = TokenChunker()
+
+
+def _parse_and_chunk(path: str, content_hash: str) -> ParsedFile:
+    try:
+        text_content = FileParser(path).parse()
+        chunks = list(_chunker.chunks(text_content))
+    except Exception as e:
+        return ParsedFile(path, content_hash, None, [], f"{type(e).__name__}: {e}")
+    return ParsedFile(path, content_hash, text_content, chunks, None)
+
+
+def _existing_hashes(db: Session, hashes: List[str]) -> Set[str]:
+    return set(
+        db.scalars(
+            select(File.content_hash).where(File.content_hash.in_(set(hashes)))
+        ).all()
+    )
+
+
+def parse_new_files(
+    executor: ProcessPoolExecutor,
+    db: Session,
+    paths: Iterable[str],
+    prefetch: int,
+    counts: dict,
+) -> Iterator[ParsedFile]:
+    """Parse and chunk the files not loaded yet, keeping up to prefetch
+    files in the pool. Yields them in the order they finish."""
+    seen: Set[str] = set()
+    pending = set()
+    for window in _batches(paths, HASH_LOOKUP_SIZE):
+        hashes = list(executor.map(file_hash, window, chunksize=16))
+        existing = _existing_hashes(db, hashes)
+        # Don't hold a transaction open while the pool is busy
+        db.rollback()
+        for path, content_hash in zip(window, hashes):
+            if content_hash in existing or content_hash in seen:
+                counts["skipped"] += 1
+                continue
+            seen.add(content_hash)
+            while len(pending) >= prefetch:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+            pending.add(executor.submit(_parse_and_chunk, path, content_hash))
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            yield future.result()
+
+
+def _encode_field(value) -> bytes:
+    if isinstance(value, int):
+        return struct.pack(">i", value)
+    if isinstance(value, str):
+        # Postgres text can't contain NUL characters
+        return value.replace("\x00", "").encode("utf-8")
+    # pgvector's binary format, encoded by the pgvector package itself
+    return Vector(value).to_binary()
+
+
+def copy_buffer(rows: Iterable[tuple]) -> io.BytesIO:
+    """Rows of int, str and embedding values in COPY binary format"""
+    buffer = io.BytesIO()
+    buffer.write(_COPY_HEADER)
+    for row in rows:
+        buffer.write(struct.pack(">h", len(row)))
+        for value in row:
+            data = _encode_field(value)
+            buffer.write(struct.pack(">i", len(data)))
+            buffer.write(data)
+    buffer.write(_COPY_TRAILER)
+    buffer.seek(0)
+    return buffer
+
+
+def load_batch(db: Session, files: List[ParsedFile]) -> int:
+    """Embed the chunks of files and COPY them, with the files, into the
+    database. The caller commits. Returns the number of chunks."""
+    chunk_texts = [chunk for parsed in files for chunk in parsed.chunks]
+    embeddings = []
+    for _, batch_embeddings in embed_with_cache(db, chunk_texts):
+        embeddings.extend(batch_embeddings)
+
+    file_ids = db.scalars(
+        text(
+            "SELECT nextval(pg_get_serial_sequence('files', 'file_id')) "
+            "FROM generate_series(1, :count)"
+        ),
+        {"count": len(files)},
+    ).all()
+
+    cursor = db.connection().connection.cursor()
+    cursor.copy_expert(
+        f"COPY {File.__tablename__} (file_id, file_name, file_content, content_hash) "
+        "FROM STDIN WITH (FORMAT binary)",
+        copy_buffer(
+            (
+                file_id,
+                os.path.basename(parsed.path)[:255],
+                parsed.text,
+                parsed.content_hash,
+            )
+            for file_id, parsed in zip(file_ids, files)
+        ),
+    )
+    chunk_rows = (
+        (file_id, chunk)
+        for file_id, parsed in zip(file_ids, files)
+        for chunk in parsed.chunks
+    )
+    cursor.copy_expert(
+        f"COPY {FileChunk.__tablename__} (file_id, chunk_text, embedding_vector) "
+        "FROM STDIN WITH (FORMAT binary)",
+        copy_buffer(
+            (file_id, chunk, embedding)
+            for (file_id, chunk), embedding in zip(chunk_rows, embeddings)
+        ),
+    )
+    return len(chunk_texts)
+
+
+def drop_indexes() -> None:
+    with engine.begin() as connection:
+        for index_name in (vector_index_name(),) + DEFERRED_INDEXES:
+            connection.execute(text(f"DROP INDEX IF EXISTS {index_name}"))
+
+
+def missing_indexes(db: Session) -> Set[str]:
+    """Deferred indexes that don't exist, e.g. left dropped by a crashed load"""
+    wanted = set(DEFERRED_INDEXES)
+    if VECTOR_INDEX_TYPE != "none":
+        wanted.add(vector_index_name())
+    existing = db.scalars(
+        text("SELECT indexname FROM pg_indexes WHERE tablename = 'file_chunks'")
+    )
+    return wanted - set(existing)
+
+
+def build_indexes() -> None:
+    with engine.begin() as connection:
+        for statement in SCHEMA_UPGRADES:
+            connection.execute(text(statement))
+    ensure_vector_index()
+
+
+def _report(counts: dict, elapsed: float) -> str:
+    return (
+        f"{counts['documents']} docs ({counts['documents'] / elapsed:.1f}/s), "
+        f"{counts['chunks']} chunks ({counts['chunks'] / elapsed:.1f}/s), "
+        f"{counts['skipped']} skipped, {counts['failed']} failed"
+    )
+
+
+def run(root: str, workers: int, batch_size: int, defer_indexes: str) -> dict:
+    if DB_INIT_ON_STARTUP:
+        init_db()
+    db = SessionLocal()
+    if defer_indexes == "auto":
+        empty = not db.scalar(text("SELECT EXISTS (SELECT 1 FROM file_chunks)"))
+        # Indexes missing at the start are only built at the end anyway
+        defer_indexes = "always" if empty or missing_indexes(db) else "never"
+        db.rollback()
+    if defer_indexes == "always":
+        print("Dropping file_chunks indexes until the load is done")
+        drop_indexes()
+
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+    else:
+        context = multiprocessing.get_context("spawn")
+
+    counts = {"documents": 0, "chunks": 0, "skipped": 0, "failed": 0}
+    start = time.perf_counter()
+    try:
+        with ProcessPoolExecutor(
+            workers,
+            mp_context=context,
+            initializer=_init_process,
+            initargs=(ocr_budget.create(context),),
+        ) as executor:
+            parsed_files = parse_new_files(
+                executor, db, iter_paths(root), 2 * max(batch_size, workers), counts
+            )
+            for batch in _batches(parsed_files, batch_size):
+                for parsed in batch:
+                    if parsed.error is not None:
+                        print(f"Error parsing {parsed.path}: {parsed.error}")
+                files = [parsed for parsed in batch if parsed.error is None]
+                counts["failed"] += len(batch) - len(files)
+                if not files:
+                    continue
+                try:
+                    chunks = load_batch(db, files)
+                    db.commit()
+                except Exception:
+                    db.rollback()
+                    raise
+                counts["documents"] += len(files)
+                counts["chunks"] += chunks
+                print(_report(counts, time.perf_counter() - start))
+        evict(db)
+        db.commit()
+    finally:
+        db.close()
+        load_seconds = time.perf_counter() - start
+        # Always, as an earlier run that was killed before it got here may
+        # have left them dropped. Existing indexes are left as they are.
+        print("Building file_chunks indexes")
+        index_start = time.perf_counter()
+        build_indexes()
+        print(f"Built indexes in {time.perf_counter() - index_start:.1f}s")
+
+    elapsed = time.perf_counter() - start
+    print(f"Loaded in {load_seconds:.1f}s, {elapsed:.1f}s with indexes")
+    print(_report(counts, elapsed))
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk load a directory of documents")
+    parser.add_argument("root", help="directory to load, searched recursively")
+    parser.add_argument("--workers", type=int, default=BULK_INGEST_WORKERS)
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=BULK_INGEST_BATCH_SIZE,
+        help="documents per transaction",
+    )
+    parser.add_argument(
+        "--defer-indexes", choices=["auto", "always", "never"], default="auto"
+    )
+    args = parser.parse_args()
+    run(args.root, args.workers, args.batch_size, args.defer_indexes)
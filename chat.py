@@ -0,0 +1,72 @@
+import os
+from typing import AsyncIterator, List, Optional
+from azure.ai.inference.aio import ChatCompletionsClient
+from azure.ai.inference.models import SystemMessage, UserMessage
+from azure.core.credentials import AzureKeyCredential
+from dotenv import load_dotenv
+from metrics import in_flight
+
+load_dotenv()
+
+endpoint = os.getenv("CHAT_ENDPOINT", "https://models.inference.ai.azure.com")
+model_name = "Mistral-large-2407"
+
+completion_settings = {
+    "model": model_name,
+    "temperature": 0.8,
+    "max_tokens": 4096,
+    "top_p": 0.1,
+}
+
+
+def create_chat_client() -> Optional[ChatCompletionsClient]:
+    """Create the async chat client, or None if no token is configured.
+
+    The client keeps a pooled HTTP session, so create it once at startup and
+    close it on shutdown.
+    """
+    token = os.getenv("GITHUB_TOKEN")
+    if token is None:
+        return None
+    return ChatCompletionsClient(
+        endpoint=endpoint, credential=AzureKeyCredential(token)
+    )
+
+
+def build_messages(context: str, question: str) -> List:
+    # Update the system message with the context
+    system_message = (
+        f"You are an assistant designed to provide accurate and helpful responses strictly based on the given context. "
+        f"If a user's question is not addressed by the provided context, respond with: "
+        f"`I'm sorry, I don't have relevant information on that!` "
+        f"Do not mention that you have been provided with the context."
+        f"Here is the context for your responses: {context}"
+    )
+    return [
+        SystemMessage(content=system_message),
+        UserMessage(content=question),
+    ]
+
+
+async def complete(client: ChatCompletionsClient, context: str, question: str) -> str:
+    with in_flight("chat"):
+        response = await client.complete(
+            messages=build_messages(context, question), **completion_settings
+        )
+    return response.choices[0].message.content
+
+
+async def stream_completion(
+    client: ChatCompletionsClient, context: str, question: str
+) -> AsyncIterator[str]:
+    """Yield pieces of the answer as the model generates them"""
+    with in_flight("chat"):
+        response = await client.complete(
+            messages=build_messages(context, question),
+            stream=True,
+            **completion_settings,
+        )
+        async with response:
+            async for update in response:
+                if update.choices and update.choices[0].delta.content:
+                    yield update.choices[0].delta.content
@@ -0,0 +1,125 @@
+"""Token-budgeted chunking of document text.
+
+Text is split lazily into sentences and paragraphs, which are packed into
+chunks of about CHUNK_TOKENS tokens as counted by the embedding model's
+tokenizer. Consecutive chunks share up to CHUNK_OVERLAP_TOKENS tokens of
+trailing sentences.
+
+The budget is approximate: segments are counted on their own and then
+joined with spaces, and a space the tokenizer doesn't merge into the next
+word costs a token of its own. Chunks can exceed CHUNK_TOKENS by a few
+tokens (at most 402 for 400 on the benchmark corpus), far below the
+embedding model's input limit.
+"""
+
+import os
+import re
+from collections import deque
+from functools import lru_cache
+from typing import Iterator, Optional
+import tiktoken
+from dotenv import load_dotenv
+from metrics import StageTimer
+
+load_dotenv()
+
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "400"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "50"))
+# Tokenizer used by text-embedding-3-small
+ENCODING_NAME = "cl100k_base"
+
+# Sentence ends followed by whitespace, or blank lines between paragraphs
+_SEGMENT_BOUNDARY = re.compile(r"(?<=[.!?])\s+|\n\s*\n")
+
+
+@lru_cache(maxsize=1)
+def _encoding() -> tiktoken.Encoding:
+    return tiktoken.get_encoding(ENCODING_NAME)
+
+
+def count_tokens(text: str) -> int:
+    """Tokens in text, as counted by the embedding model's tokenizer"""
+    return len(_encoding().encode_ordinary(text))
+
+
+def iter_segments(text: str) -> Iterator[str]:
+    """Lazily split text into sentences and paragraphs"""
+    start = 0
+    for match in _SEGMENT_BOUNDARY.finditer(text):
+        segment = text[start : match.start()].strip()
+        start = match.end()
+        if segment:
+            yield segment
+    segment = text[start:].strip()
+    if segment:
+        yield segment
+
+
+class TokenChunker:
+    def __init__(
+        self,
+        max_tokens: int = CHUNK_TOKENS,
+        overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+        encoding_name: str = ENCODING_NAME,
+    ):
+        if not 0 <= overlap_tokens < max_tokens:
+            raise ValueError("overlap_tokens must be between 0 and max_tokens")
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self.encoding = tiktoken.get_encoding(encoding_name)
+
+    def chunks(self, text: str, timer: Optional[StageTimer] = None) -> Iterator[str]:
+        """Yield chunks of about max_tokens tokens (see above), in document
+        order.
+
+        If a timer is given, tokenizer calls are timed as its "tokenize" stage.
+        """
+        encode = self.encoding.encode_ordinary
+        if timer is not None:
+            encode = timer.wrap("tokenize", encode)
+        window = deque()  # (segment, token count) pairs of the current chunk
+        window_tokens = 0
+        for segment in iter_segments(text):
+            tokens = encode(segment)
+
+            # A single oversized segment (e.g. a flattened table) is split
+            # on token boundaries
+            if len(tokens) > self.max_tokens:
+                if window:
+                    yield self._join(window)
+                    window.clear()
+                    window_tokens = 0
+                yield from self._split_tokens(tokens)
+                continue
+
+            if window and window_tokens + len(tokens) > self.max_tokens:
+                yield self._join(window)
+                # Carry trailing segments over as overlap, as long as they
+                # fit in the overlap budget and leave room for this segment
+                overlap = deque()
+                overlap_tokens = 0
+                for previous, count in reversed(window):
+                    if (
+                        overlap_tokens + count > self.overlap_tokens
+                        or overlap_tokens + count + len(tokens) > self.max_tokens
+                    ):
+                        break
+                    overlap.appendleft((previous, count))
+                    overlap_tokens += count
+                window, window_tokens = overlap, overlap_tokens
+
+            window.append((segment, len(tokens)))
+            window_tokens += len(tokens)
+
+        if window:
+            yield self._join(window)
+
+    def _join(self, window) -> str:
+        return " ".join(segment for segment, _ in window)
+
+    def _split_tokens(self, tokens: list) -> Iterator[str]:
+        step = self.max_tokens - self.overlap_tokens
+        for start in range(0, len(tokens), step):
+            yield self.encoding.decode(tokens[start : start + self.max_tokens])
+            if start + self.max_tokens >= len(tokens):
+                break
@@ -0,0 +1,106 @@
+"""Post-retrieval selection of the chunks passed to the model.
+
+Retrieval over-fetches CONTEXT_CANDIDATES chunks with their vectors. Maximal
+marginal relevance then picks chunks that are relevant to the question but
+not redundant with the ones already picked, and near-duplicates are dropped
+outright. The picks are packed into CONTEXT_TOKEN_BUDGET tokens and joined
+in document order.
+"""
+
+import os
+from typing import List, NamedTuple, Sequence
+import numpy as np
+from dotenv import load_dotenv
+from db import FileChunk
+from chunker import count_tokens
+
+load_dotenv()
+
+CONTEXT_MMR_ENABLED = os.getenv("CONTEXT_MMR_ENABLED", "true").lower() == "true"
+# Chunks fetched by retrieval for MMR to choose from
+CONTEXT_CANDIDATES = int(os.getenv("CONTEXT_CANDIDATES", "30"))
+# Trade-off between relevance (1.0) and diversity (0.0)
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.7"))
+# Candidates at least this similar to a picked chunk are never picked
+MMR_DUPLICATE_THRESHOLD = float(os.getenv("MMR_DUPLICATE_THRESHOLD", "0.95"))
+# Upper bound for the context tokens, counted with the embedding model's
+# tokenizer which is close enough to the chat model's for budgeting
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+
+
+class PackedContext(NamedTuple):
+    text: str
+    chunks: List[FileChunk]
+    candidates: int
+    tokens: int
+
+
+def _unit_rows(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def mmr(
+    query: Sequence[float],
+    vectors: np.ndarray,
+    k: int,
+    lambda_: float = MMR_LAMBDA,
+    duplicate_threshold: float = MMR_DUPLICATE_THRESHOLD,
+) -> List[int]:
+    """Indices of up to k rows of vectors in maximal marginal relevance order.
+
+    Each step picks the row maximizing
+    lambda_ * sim(row, query) - (1 - lambda_) * max sim(row, picked rows),
+    using cosine similarity.
+    """
+    vectors = _unit_rows(np.asarray(vectors, dtype=np.float32))
+    relevance = vectors @ _unit_rows(np.asarray(query, dtype=np.float32))
+    # Highest similarity to any picked row, rows unrelated to all picks
+    # (similarity <= 0) aren't rewarded
+    redundancy = np.zeros(len(vectors), dtype=np.float32)
+    available = np.ones(len(vectors), dtype=bool)
+    picked = []
+    while len(picked) < k and available.any():
+        scores = np.where(
+            available, lambda_ * relevance - (1 - lambda_) * redundancy, -np.inf
+        )
+        best = int(np.argmax(scores))
+        picked.append(best)
+        similarity = vectors @ vectors[best]
+        np.maximum(redundancy, similarity, out=redundancy)
+        available[best] = False
+        available[similarity >= duplicate_threshold] = False
+    return picked
+
+
+def pack_context(
+    question_embedding: Sequence[float],
+    chunks: List[FileChunk],
+    limit: int,
+    budget: int = CONTEXT_TOKEN_BUDGET,
+) -> PackedContext:
+    """Pick up to limit chunks fitting in budget tokens, in document order.
+
+    chunks must have their embedding_vector loaded.
+    """
+    if not chunks:
+        return PackedContext("", [], 0, 0)
+    order = mmr(
+        question_embedding,
+        np.stack([np.asarray(chunk.embedding_vector) for chunk in chunks]),
+        limit,
+    )
+
+    # Chunks that don't fit are skipped, a smaller one further down may
+    picked, tokens = [], 0
+    for index in order:
+        count = count_tokens(chunks[index].chunk_text)
+        if tokens + count > budget:
+            continue
+        picked.append(chunks[index])
+        tokens += count
+
+    # chunk_id follows insertion order, which is document order
+    picked.sort(key=lambda chunk: chunk.chunk_id)
+    text = " ".join(chunk.chunk_text for chunk in picked)
+    return PackedContext(text, picked, len(chunks), tokens)
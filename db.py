@@ -1,19 +1,60 @@
+"""Database engine, models and schema management.
+
+Importing this module does not touch the database. Create or upgrade the
+schema once per deploy with:
+
+    python db.py
+"""
+
 import os
-from sqlalchemy import create_engine, Column, Integer, String, Text, ForeignKey
-from sqlalchemy.orm import declarative_base, sessionmaker
+import re
+from typing import Optional, Tuple
+from sqlalchemy import (
+    cast,
+    create_engine,
+    Column,
+    Integer,
+    String,
+    Text,
+    ForeignKey,
+    DateTime,
+    Computed,
+    Index,
+    func,
+    select,
+    update,
+)
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import declarative_base, sessionmaker, deferred
 from sqlalchemy.sql import text
-from sqlalchemy_utils import database_exists, create_database
-from pgvector.sqlalchemy import Vector
+from pgvector.sqlalchemy import Vector, HALFVEC, BIT
 from dotenv import load_dotenv
 
 load_dotenv()
 
 database_url = os.getenv("DB_URL")
 
-engine = create_engine(database_url)
+# Vector index settings: VECTOR_INDEX_TYPE is one of hnsw, ivfflat or none
+VECTOR_INDEX_TYPE = os.getenv("VECTOR_INDEX_TYPE", "hnsw")
+# Distance operator used for indexing and retrieval: l2, cosine or inner_product
+VECTOR_DISTANCE = os.getenv("VECTOR_DISTANCE", "l2")
+HNSW_M = int(os.getenv("HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "64"))
+IVFFLAT_LISTS = int(os.getenv("IVFFLAT_LISTS", "100"))
+# What the index stores: full (float32 vectors), halfvec (float16, half the
+# size) or binary (one bit per dimension, 1/32 of the size). The table keeps
+# the full vectors, which re-rank the candidates of a compact index.
+VECTOR_STORAGE = os.getenv("VECTOR_STORAGE", "full")
+EMBEDDING_DIMENSIONS = 1536
+# Text search configuration used for the full-text index on chunks
+TEXT_SEARCH_CONFIG = os.getenv("TEXT_SEARCH_CONFIG", "english")
+CHUNK_TSV_EXPRESSION = f"to_tsvector('{TEXT_SEARCH_CONFIG}', coalesce(chunk_text, ''))"
 
-if not database_exists(engine.url):
-    create_database(engine.url)
+# Run init_db() when the API or the worker pool starts, convenient for
+# development. Deployments run `python db.py` once instead.
+DB_INIT_ON_STARTUP = os.getenv("DB_INIT_ON_STARTUP", "false").lower() == "true"
+
+engine = create_engine(database_url)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
@@ -34,23 +75,328 @@ class File(Base):
     __tablename__ = "files"
     file_id = Column(Integer, primary_key=True)
     file_name = Column(String(255))
-    file_content = Column(Text)
+    # Can be very large, only loaded when accessed or explicitly undeferred
+    file_content = deferred(Column(Text))
+    # SHA-256 of the uploaded bytes
+    content_hash = Column(String(64), index=True)
+    # Incremented whenever the file's chunks change, see bump_chunks_version
+    chunks_version = Column(Integer, nullable=False, default=0, server_default="0")
 
 
 class FileChunk(Base):
     __tablename__ = "file_chunks"
     chunk_id = Column(Integer, primary_key=True)
-    file_id = Column(Integer, ForeignKey("files.file_id"))
+    file_id = Column(Integer, ForeignKey("files.file_id"), index=True)
     chunk_text = Column(Text)
-    embedding_vector = Column(Vector(1536))
+    embedding_vector = Column(Vector(EMBEDDING_DIMENSIONS))
+    # Maintained by Postgres, used for lexical search in hybrid retrieval
+    chunk_tsv = deferred(
+        Column(TSVECTOR, Computed(CHUNK_TSV_EXPRESSION, persisted=True))
+    )
+
+    __table_args__ = (
+        Index("ix_file_chunks_chunk_tsv", "chunk_tsv", postgresql_using="gin"),
+    )
+
+
+class EmbeddingCache(Base):
+    __tablename__ = "embedding_cache"
+    model = Column(String(100), primary_key=True)
+    # SHA-256 of the normalized text, see embedding_cache.text_hash
+    text_hash = Column(String(64), primary_key=True)
+    embedding = Column(Vector(EMBEDDING_DIMENSIONS))
+    last_used_at = Column(
+        DateTime(timezone=True), server_default=func.now(), index=True
+    )
+
+
+class IngestJob(Base):
+    __tablename__ = "ingest_jobs"
+    job_id = Column(Integer, primary_key=True)
+    file_id = Column(Integer, ForeignKey("files.file_id"), index=True)
+    # queued -> running -> done | failed
+    status = Column(String(20), nullable=False, default="queued", index=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    # Chunks committed so far, a retry resumes after them
+    chunks_done = Column(Integer, nullable=False, default=0, server_default="0")
+    error = Column(Text)
+    # Running jobs whose lease has expired are picked up again by other workers
+    locked_until = Column(DateTime(timezone=True))
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(
+        DateTime(timezone=True), server_default=func.now(), onupdate=func.now()
+    )
+
+
+VECTOR_OPS = {
+    "l2": "vector_l2_ops",
+    "cosine": "vector_cosine_ops",
+    "inner_product": "vector_ip_ops",
+}
+HALFVEC_OPS = {
+    "l2": "halfvec_l2_ops",
+    "cosine": "halfvec_cosine_ops",
+    "inner_product": "halfvec_ip_ops",
+}
+
+if VECTOR_DISTANCE not in VECTOR_OPS:
+    raise ValueError(f"Unsupported VECTOR_DISTANCE: {VECTOR_DISTANCE}")
+if VECTOR_INDEX_TYPE not in ("hnsw", "ivfflat", "none"):
+    raise ValueError(f"Unsupported VECTOR_INDEX_TYPE: {VECTOR_INDEX_TYPE}")
+if VECTOR_STORAGE not in ("full", "halfvec", "binary"):
+    raise ValueError(f"Unsupported VECTOR_STORAGE: {VECTOR_STORAGE}")
+
+
+def vector_distance(column, vector):
+    """Distance expression matching the configured index operator class"""
+    if VECTOR_DISTANCE == "cosine":
+        return column.cosine_distance(vector)
+    if VECTOR_DISTANCE == "inner_product":
+        return column.max_inner_product(vector)
+    return column.l2_distance(vector)
+
+
+def index_distance(column, vector):
+    """Distance expression served by the embedding index.
+
+    Same as vector_distance for full storage. For halfvec and binary storage
+    it matches the index expression, and its ranking is approximate: use it
+    to fetch candidates and re-rank them with vector_distance.
+    """
+    if VECTOR_STORAGE == "halfvec":
+        halfvec = HALFVEC(EMBEDDING_DIMENSIONS)
+        # The query may be a vector column, e.g. in a LATERAL join
+        column, vector = cast(column, halfvec), cast(vector, halfvec)
+        if VECTOR_DISTANCE == "cosine":
+            return column.cosine_distance(vector)
+        if VECTOR_DISTANCE == "inner_product":
+            return column.max_inner_product(vector)
+        return column.l2_distance(vector)
+    if VECTOR_STORAGE == "binary":
+        # Hamming distance between the sign bits of the two vectors
+        bits = BIT(EMBEDDING_DIMENSIONS)
+        query = cast(vector, Vector(EMBEDDING_DIMENSIONS))
+        return cast(func.binary_quantize(column), bits).hamming_distance(
+            cast(func.binary_quantize(query), bits)
+        )
+    return vector_distance(column, vector)
+
+
+def vector_index_name() -> str:
+    """Name of the embedding index for the current configuration.
+
+    The build parameters are part of the name, so changing them in the
+    environment results in a rebuild on the next startup.
+    """
+    if VECTOR_INDEX_TYPE == "hnsw":
+        params = f"m{HNSW_M}_ef{HNSW_EF_CONSTRUCTION}"
+    else:
+        params = f"lists{IVFFLAT_LISTS}"
+    if VECTOR_STORAGE != "full":
+        # Binary indexes always use hamming distance
+        distance = "hamming" if VECTOR_STORAGE == "binary" else VECTOR_DISTANCE
+        params = f"{VECTOR_STORAGE}_{distance}_{params}"
+    else:
+        params = f"{VECTOR_DISTANCE}_{params}"
+    return f"ix_file_chunks_embedding_{VECTOR_INDEX_TYPE}_{params}"
+
+
+def _vector_index_ddl() -> str:
+    if VECTOR_INDEX_TYPE == "hnsw":
+        options = f"m = {HNSW_M}, ef_construction = {HNSW_EF_CONSTRUCTION}"
+    else:
+        options = f"lists = {IVFFLAT_LISTS}"
+    if VECTOR_STORAGE == "halfvec":
+        key = (
+            f"(embedding_vector::halfvec({EMBEDDING_DIMENSIONS})) "
+            f"{HALFVEC_OPS[VECTOR_DISTANCE]}"
+        )
+    elif VECTOR_STORAGE == "binary":
+        key = (
+            f"(binary_quantize(embedding_vector)::bit({EMBEDDING_DIMENSIONS})) "
+            "bit_hamming_ops"
+        )
+    else:
+        key = f"embedding_vector {VECTOR_OPS[VECTOR_DISTANCE]}"
+    # Built concurrently so that uploads and queries carry on, using the
+    # previous index, while a new one is built over existing rows
+    return (
+        f"CREATE INDEX CONCURRENTLY {vector_index_name()} ON file_chunks "
+        f"USING {VECTOR_INDEX_TYPE} ({key}) WITH ({options})"
+    )
+
+
+def ensure_vector_index(bind=engine):
+    """Create the configured embedding index and drop stale ones.
 
+    This is also the migration between index configurations (type, distance,
+    build parameters or VECTOR_STORAGE): the new index is built concurrently
+    over the existing rows, and the old one is dropped once it is ready.
+    """
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction
+    with bind.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        indexes = connection.execute(
+            text(
+                "SELECT c.relname, i.indisvalid FROM pg_index i "
+                "JOIN pg_class c ON c.oid = i.indexrelid "
+                "JOIN pg_class t ON t.oid = i.indrelid "
+                "WHERE t.relname = 'file_chunks' "
+                "AND c.relname LIKE 'ix_file_chunks_embedding_%'"
+            )
+        ).all()
+        wanted = vector_index_name() if VECTOR_INDEX_TYPE != "none" else None
+        valid = {name for name, is_valid in indexes if is_valid}
+
+        if wanted is not None and wanted not in valid:
+            # IVFFlat clusters are trained on the rows present at build time,
+            # so building on an empty table gives a useless index
+            has_rows = connection.scalar(
+                text("SELECT EXISTS (SELECT 1 FROM file_chunks)")
+            )
+            if VECTOR_INDEX_TYPE == "ivfflat" and not has_rows:
+                print("Skipping IVFFlat index creation until file_chunks has rows")
+                wanted = None
+            else:
+                # Left behind invalid by an interrupted concurrent build
+                connection.execute(text(f"DROP INDEX IF EXISTS {wanted}"))
+                print(f"Building vector index {wanted}")
+                connection.execute(text(_vector_index_ddl()))
+
+        for index_name, _ in indexes:
+            if index_name != wanted:
+                connection.execute(
+                    text(f"DROP INDEX CONCURRENTLY IF EXISTS {index_name}")
+                )
+
+
+def rebuild_vector_index(bind=engine):
+    """Rebuild the embedding index, e.g. after a large load into an IVFFlat index"""
+    if VECTOR_INDEX_TYPE == "none":
+        return
+    with bind.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        connection.execute(
+            text(f"DROP INDEX CONCURRENTLY IF EXISTS {vector_index_name()}")
+        )
+    ensure_vector_index(bind)
+
+
+def bump_chunks_version(db, file_id: int) -> None:
+    """Record that a file's chunks changed, which invalidates data cached
+    from them (e.g. answers). The caller commits."""
+    db.execute(
+        update(File)
+        .where(File.file_id == file_id)
+        .values(chunks_version=File.chunks_version + 1)
+    )
+
+
+def get_chunks_version(db, file_id: int) -> Optional[int]:
+    """Current chunks version of a file, None if it doesn't exist"""
+    return db.scalar(select(File.chunks_version).where(File.file_id == file_id))
+
+
+# Installed pgvector version, read once per process by pgvector_version
+_pgvector_version: Optional[Tuple[int, ...]] = None
+
+
+def pgvector_version(db) -> Tuple[int, ...]:
+    """The installed vector extension's version, e.g. (0, 8, 0)"""
+    global _pgvector_version
+    if _pgvector_version is None:
+        version = db.scalar(
+            text("SELECT extversion FROM pg_extension WHERE extname = 'vector'")
+        )
+        _pgvector_version = tuple(
+            int(part) for part in re.findall(r"\d+", version or "")
+        )
+    return _pgvector_version
+
+
+def set_search_params(
+    db,
+    ef_search: Optional[int] = None,
+    probes: Optional[int] = None,
+    iterative_scan: Optional[str] = None,
+):
+    """Set per-query ANN recall knobs for the current transaction.
+
+    Higher values of hnsw.ef_search / ivfflat.probes improve recall at the
+    cost of latency. iterative_scan (pgvector >= 0.8) lets filtered and
+    paginated index scans continue past ef_search / probes candidates, "off"
+    leaves it unset. "auto" is strict_order for HNSW and relaxed_order for
+    IVFFlat if the installed pgvector supports it, otherwise off.
+    """
+    if iterative_scan == "auto":
+        if pgvector_version(db) < (0, 8):
+            iterative_scan = None
+        else:
+            iterative_scan = (
+                "strict_order" if VECTOR_INDEX_TYPE == "hnsw" else "relaxed_order"
+            )
+    if ef_search is not None:
+        db.execute(
+            text("SELECT set_config('hnsw.ef_search', :value, true)"),
+            {"value": str(ef_search)},
+        )
+    if probes is not None:
+        db.execute(
+            text("SELECT set_config('ivfflat.probes', :value, true)"),
+            {"value": str(probes)},
+        )
+    if iterative_scan not in (None, "off") and VECTOR_INDEX_TYPE != "none":
+        db.execute(
+            text("SELECT set_config(:name, :value, true)"),
+            {"name": f"{VECTOR_INDEX_TYPE}.iterative_scan", "value": iterative_scan},
+        )
+
+
+# Idempotent changes applied to databases created by older versions
+SCHEMA_UPGRADES = [
+    "CREATE INDEX IF NOT EXISTS ix_file_chunks_file_id ON file_chunks (file_id)",
+    "ALTER TABLE files ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64)",
+    "CREATE INDEX IF NOT EXISTS ix_files_content_hash ON files (content_hash)",
+    "ALTER TABLE files ADD COLUMN IF NOT EXISTS chunks_version INTEGER NOT NULL DEFAULT 0",
+    "ALTER TABLE ingest_jobs ADD COLUMN IF NOT EXISTS chunks_done INTEGER NOT NULL DEFAULT 0",
+    "ALTER TABLE file_chunks ADD COLUMN IF NOT EXISTS chunk_tsv tsvector "
+    f"GENERATED ALWAYS AS ({CHUNK_TSV_EXPRESSION}) STORED",
+    "CREATE INDEX IF NOT EXISTS ix_file_chunks_chunk_tsv "
+    "ON file_chunks USING gin (chunk_tsv)",
+]
+
+
+def init_db(bind=engine):
+    """Create the database, extension, tables and indexes if missing.
+
+    Idempotent, run it once per deploy rather than from every process.
+    Failures are raised, so a failed migration fails the deploy.
+    """
+    from sqlalchemy_utils import database_exists, create_database
+
+    if not database_exists(bind.url):
+        create_database(bind.url)
+
+    # Ensure the vector extension is enabled
+    with bind.begin() as connection:
+        connection.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
+
+    try:
+        # Create tables
+        Base.metadata.create_all(bind)
+        # create_all does not add columns or indexes to tables that already exist
+        with bind.begin() as connection:
+            for statement in SCHEMA_UPGRADES:
+                connection.execute(text(statement))
+    except Exception as e:
+        print(f"Error creating tables: {e}")
+        raise
+
+    try:
+        ensure_vector_index(bind)
+    except Exception as e:
+        print(f"Error creating vector index: {e}")
+        raise
 
-# Ensure the vector extension is enabled
-with engine.begin() as connection:
-    connection.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
 
-try:
-    # Create tables
-    Base.metadata.create_all(engine)
-except Exception as e:
-    print(f"Error creating tables: {e}")
+if __name__ == "__main__":
+    init_db()
+    print("Database schema is up to date")
@@ -0,0 +1,258 @@
+"""Persistent embedding cache keyed by (model, hash of normalized text).
+
+Chunks that were embedded before, e.g. re-uploaded documents or boilerplate
+shared between documents, are served from the embedding_cache table instead
+of calling the embeddings API.
+"""
+
+import hashlib
+import os
+import threading
+import unicodedata
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, TYPE_CHECKING
+from sqlalchemy import select, update, delete, func, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from db import EmbeddingCache
+from cache import LRUCache
+from metrics import CACHE_REQUESTS, in_flight
+from embeddings import (
+    get_client,
+    model_name,
+    embed_texts,
+    EMBEDDING_MAX_BATCH_SIZE,
+    EMBEDDING_CONCURRENCY,
+)
+
+if TYPE_CHECKING:  # openai is slow to import, see embeddings.create_client
+    from openai import OpenAI
+
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+# The least recently used entries are evicted above this many rows
+EMBEDDING_CACHE_MAX_ROWS = int(os.getenv("EMBEDDING_CACHE_MAX_ROWS", "1000000"))
+
+# In-process cache of question embeddings used by /ask
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "10000"))
+QUERY_EMBEDDING_CACHE_TTL = float(os.getenv("QUERY_EMBEDDING_CACHE_TTL", "3600"))
+# Also share question embeddings between API workers via embedding_cache
+QUERY_EMBEDDING_CACHE_SHARED = (
+    os.getenv("QUERY_EMBEDDING_CACHE_SHARED", "false").lower() == "true"
+)
+
+# Rows per INSERT statement when writing new entries
+STORE_BATCH_SIZE = 500
+
+# Texts looked up in the cache per round trip, large enough to keep
+# EMBEDDING_CONCURRENCY full batches in flight for the misses
+LOOKUP_WINDOW = EMBEDDING_MAX_BATCH_SIZE * EMBEDDING_CONCURRENCY
+
+
+class CacheStats:
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def record(self, hits: int, misses: int) -> None:
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+        CACHE_REQUESTS.labels(cache=self.name, result="hit").inc(hits)
+        CACHE_REQUESTS.labels(cache=self.name, result="miss").inc(misses)
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hit_rate}
+
+
+stats = CacheStats("embeddings")
+query_cache = LRUCache(QUERY_EMBEDDING_CACHE_SIZE, ttl=QUERY_EMBEDDING_CACHE_TTL)
+shared_query_stats = CacheStats("query_embeddings_shared")
+
+
+def normalize_text(text: str) -> str:
+    return unicodedata.normalize("NFC", " ".join(text.split()))
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+def lookup(db: Session, model: str, hashes: Iterable[str]) -> Dict[str, list]:
+    """Fetch cached embeddings for the given hashes and mark them as used"""
+    hashes = list(set(hashes))
+    if not hashes:
+        return {}
+    rows = db.execute(
+        select(EmbeddingCache.text_hash, EmbeddingCache.embedding).where(
+            EmbeddingCache.model == model, EmbeddingCache.text_hash.in_(hashes)
+        )
+    ).all()
+    found = {row.text_hash: row.embedding for row in rows}
+    if found:
+        # Rows another worker is touching are skipped rather than waited on,
+        # so concurrent ingests of shared text never block each other
+        touched = (
+            select(EmbeddingCache.model, EmbeddingCache.text_hash)
+            .where(
+                EmbeddingCache.model == model,
+                EmbeddingCache.text_hash.in_(list(found)),
+            )
+            .with_for_update(skip_locked=True)
+        )
+        db.execute(
+            update(EmbeddingCache)
+            .where(tuple_(EmbeddingCache.model, EmbeddingCache.text_hash).in_(touched))
+            .values(last_used_at=func.now())
+        )
+    return found
+
+
+def store(db: Session, model: str, embeddings: Dict[str, list]) -> None:
+    """Insert new cache entries in bulk. The caller commits."""
+    # Sorted so concurrent writers take row locks in the same order
+    items = sorted(embeddings.items())
+    for start in range(0, len(items), STORE_BATCH_SIZE):
+        db.execute(
+            insert(EmbeddingCache)
+            .values(
+                [
+                    {"model": model, "text_hash": key, "embedding": embedding}
+                    for key, embedding in items[start : start + STORE_BATCH_SIZE]
+                ]
+            )
+            .on_conflict_do_nothing()
+        )
+
+
+def evict(db: Session, max_rows: int = EMBEDDING_CACHE_MAX_ROWS) -> int:
+    """Delete the least recently used entries above max_rows"""
+    excess = db.scalar(select(func.count()).select_from(EmbeddingCache)) - max_rows
+    if excess <= 0:
+        return 0
+    oldest = (
+        select(EmbeddingCache.model, EmbeddingCache.text_hash)
+        .order_by(EmbeddingCache.last_used_at)
+        .limit(excess)
+    )
+    db.execute(
+        delete(EmbeddingCache).where(
+            tuple_(EmbeddingCache.model, EmbeddingCache.text_hash).in_(oldest)
+        )
+    )
+    return excess
+
+
+def embed_with_cache(
+    db: Session,
+    texts: Iterable[str],
+    client: Optional["OpenAI"] = None,
+    window_size: int = LOOKUP_WINDOW,
+) -> Iterator[Tuple[List[str], List[list]]]:
+    """Cache-aware drop-in for embeddings.embed_batches.
+
+    Texts are looked up in bulk per window of window_size texts, only misses
+    (deduplicated) are sent to the API and the new vectors are written back
+    in bulk on the same session. Yields (texts, embeddings) pairs in input
+    order, one per window.
+    """
+    texts = iter(texts)
+    while True:
+        window = list(islice(texts, window_size))
+        if not window:
+            return
+        if not EMBEDDING_CACHE_ENABLED:
+            yield window, embed_texts(window, client)
+            continue
+
+        hashes = [text_hash(text) for text in window]
+        found = lookup(db, model_name, hashes)
+
+        missing: Dict[str, str] = {}
+        for key, text in zip(hashes, window):
+            if key not in found and key not in missing:
+                missing[key] = text
+        stats.record(hits=len(window) - len(missing), misses=len(missing))
+
+        if missing:
+            new_embeddings = dict(zip(missing, embed_texts(missing.values(), client)))
+            store(db, model_name, new_embeddings)
+            found.update(new_embeddings)
+
+        yield window, [found[key] for key in hashes]
+
+
+def embed_query(
+    question: str, db: Session = None, client: Optional["OpenAI"] = None
+) -> list:
+    """Embed a question, checking the in-process cache first and then, if
+    QUERY_EMBEDDING_CACHE_SHARED is set, the embedding_cache table.
+    """
+    key = (model_name, text_hash(question))
+    embedding = query_cache.get(key)
+    if embedding is not None:
+        return embedding
+
+    shared = QUERY_EMBEDDING_CACHE_SHARED and db is not None
+    if shared:
+        embedding = lookup(db, model_name, [key[1]]).get(key[1])
+        shared_query_stats.record(
+            hits=int(embedding is not None), misses=int(embedding is None)
+        )
+
+    if embedding is None:
+        client = client or get_client()
+        with in_flight("embeddings"):
+            response = client.embeddings.create(input=question, model=model_name)
+        embedding = response.data[0].embedding
+        if shared:
+            store(db, model_name, {key[1]: embedding})
+
+    if shared:
+        db.commit()
+    query_cache.set(key, embedding)
+    return embedding
+
+
+def embed_queries(
+    questions: List[str], db: Session = None, client: Optional["OpenAI"] = None
+) -> List[list]:
+    """Embed many questions like embed_query, with a single embeddings API
+    request for all the cache misses (up to EMBEDDING_MAX_BATCH_SIZE).
+    """
+    keys = [(model_name, text_hash(question)) for question in questions]
+    found = {}
+    for key in keys:
+        embedding = query_cache.get(key)
+        if embedding is not None:
+            found[key] = embedding
+
+    missing = {key: q for key, q in zip(keys, questions) if key not in found}
+    fetched = {}
+    shared = QUERY_EMBEDDING_CACHE_SHARED and db is not None
+    if shared and missing:
+        cached = lookup(db, model_name, [key[1] for key in missing])
+        shared_query_stats.record(hits=len(cached), misses=len(missing) - len(cached))
+        for key in list(missing):
+            if key[1] in cached:
+                fetched[key] = cached[key[1]]
+                del missing[key]
+
+    if missing:
+        new_embeddings = dict(zip(missing, embed_texts(missing.values(), client)))
+        if shared:
+            store(db, model_name, {key[1]: e for key, e in new_embeddings.items()})
+        fetched.update(new_embeddings)
+
+    if shared:
+        db.commit()
+    for key, embedding in fetched.items():
+        query_cache.set(key, embedding)
+    found.update(fetched)
+    return [found[key] for key in keys]
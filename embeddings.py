@@ -0,0 +1,142 @@
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Iterator, List, Optional, Tuple, TYPE_CHECKING
+from dotenv import load_dotenv
+from metrics import in_flight
+from chunker import count_tokens
+from rate_limit import AdaptiveLimiter, backoff, quota_exhausted, retry_after
+
+if TYPE_CHECKING:  # openai is slow to import, see create_client
+    from openai import OpenAI
+
+load_dotenv()
+
+
+endpoint = os.getenv("EMBEDDING_ENDPOINT", "https://models.inference.ai.azure.com")
+OPENAI_API_KEY = os.getenv("GITHUB_TOKEN")
+
+model_name = "text-embedding-3-small"
+
+# Provider request limits: at most 2048 inputs and ~300k tokens per request
+EMBEDDING_MAX_BATCH_SIZE = int(os.getenv("EMBEDDING_MAX_BATCH_SIZE", "2048"))
+EMBEDDING_MAX_BATCH_TOKENS = int(os.getenv("EMBEDDING_MAX_BATCH_TOKENS", "300000"))
+# Maximum number of batch requests kept in flight at once, the actual
+# number adapts to rate limiting (see embedding_limiter)
+EMBEDDING_CONCURRENCY = int(os.getenv("EMBEDDING_CONCURRENCY", "4"))
+# Retries of a batch after rate-limit, timeout and server errors
+EMBEDDING_MAX_RETRIES = int(os.getenv("EMBEDDING_MAX_RETRIES", "8"))
+
+
+def create_client() -> "OpenAI":
+    """Create an embeddings client. Worker processes each create their own."""
+    if not OPENAI_API_KEY:
+        raise ValueError("Token is not set in the environment variables.")
+    from openai import OpenAI
+
+    return OpenAI(base_url=endpoint, api_key=OPENAI_API_KEY)
+
+
+_client: Optional["OpenAI"] = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> "OpenAI":
+    """The client shared by this process, created on first use"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = create_client()
+    return _client
+
+
+def iter_batches(texts: Iterable[str]) -> Iterator[List[str]]:
+    """Group texts into batches that fit in a single embeddings request"""
+    batch: List[str] = []
+    batch_tokens = 0
+    for text in texts:
+        tokens = count_tokens(text)
+        if batch and (
+            len(batch) >= EMBEDDING_MAX_BATCH_SIZE
+            or batch_tokens + tokens > EMBEDDING_MAX_BATCH_TOKENS
+        ):
+            yield batch
+            batch = []
+            batch_tokens = 0
+        batch.append(text)
+        batch_tokens += tokens
+    if batch:
+        yield batch
+
+
+# Shared by the batch requests of this process
+embedding_limiter = AdaptiveLimiter("embeddings", EMBEDDING_CONCURRENCY)
+
+
+def _embed_batch(client: "OpenAI", batch: List[str]) -> List[List[float]]:
+    import openai
+
+    # Retries are handled here, so that rate limiting adapts the concurrency
+    client = client.with_options(max_retries=0)
+    for attempt in range(EMBEDDING_MAX_RETRIES + 1):
+        with embedding_limiter.slot() as request_round:
+            try:
+                with in_flight("embeddings"):
+                    raw = client.embeddings.with_raw_response.create(
+                        input=batch, model=model_name
+                    )
+            except openai.RateLimitError as e:
+                if attempt == EMBEDDING_MAX_RETRIES:
+                    raise
+                wait = retry_after(e.response.headers) or backoff(attempt)
+                embedding_limiter.failure(request_round, wait)
+                continue
+            except (
+                openai.APITimeoutError,
+                openai.APIConnectionError,
+                openai.InternalServerError,
+            ):
+                if attempt == EMBEDDING_MAX_RETRIES:
+                    raise
+                embedding_limiter.failure(request_round, backoff(attempt))
+                continue
+        embedding_limiter.success(quota_left=not quota_exhausted(raw.headers))
+        break
+    response = raw.parse()
+    # The API does not guarantee the order of the returned items
+    data = sorted(response.data, key=lambda item: item.index)
+    return [item.embedding for item in data]
+
+
+def embed_batches(
+    texts: Iterable[str], client: Optional["OpenAI"] = None
+) -> Iterator[Tuple[List[str], List[List[float]]]]:
+    """Embed texts in batches, keeping up to EMBEDDING_CONCURRENCY requests in
+    flight. Yields (batch, embeddings) pairs in the order of the input texts.
+    """
+    client = client or get_client()
+    # Twice as many batches as requests in flight are queued, so a batch
+    # being retried doesn't hold up the ones behind it
+    queued = 2 * EMBEDDING_CONCURRENCY
+    with ThreadPoolExecutor(max_workers=EMBEDDING_CONCURRENCY) as executor:
+        pending = deque()
+        for batch in iter_batches(texts):
+            pending.append((batch, executor.submit(_embed_batch, client, batch)))
+            if len(pending) >= queued:
+                done_batch, future = pending.popleft()
+                yield done_batch, future.result()
+        while pending:
+            done_batch, future = pending.popleft()
+            yield done_batch, future.result()
+
+
+def embed_texts(
+    texts: Iterable[str], client: Optional["OpenAI"] = None
+) -> List[List[float]]:
+    """Embed texts and return their embeddings in input order"""
+    embeddings: List[List[float]] = []
+    for _, batch_embeddings in embed_batches(texts, client):
+        embeddings.extend(batch_embeddings)
+    return embeddings
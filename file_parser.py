@@ -1,17 +1,31 @@
+import importlib
+import logging
 import os
-from typing import Type, Dict
-
-# Import all parsers
+import threading
+from typing import Type, Dict, Union
 from parsers.base_parser import BaseParser
-from parsers import TxtParser, PdfParser, DocxParser, MDParser, ImageParser
 
 
 # Parser factory with registration system
 class ParserFactory:
-    _parsers: Dict[str, Type[BaseParser]] = {}
+    """Registry of parser classes and their shared instances.
+
+    Parsers are created once per class and reused for every file of their
+    types, so they must be safe to use from several threads at once.
+
+    A parser can be registered as a "module:ClassName" path, in which case
+    the module (and the libraries it needs) is only imported when a file of
+    that type is first parsed.
+    """
+
+    _parsers: Dict[str, Union[str, Type[BaseParser]]] = {}
+    _instances: Dict[Union[str, Type[BaseParser]], BaseParser] = {}
+    _lock = threading.Lock()
 
     @classmethod
-    def register_parser(cls, extension: str, parser: Type[BaseParser]) -> None:
+    def register_parser(
+        cls, extension: str, parser: Union[str, Type[BaseParser]]
+    ) -> None:
         cls._parsers[extension] = parser
 
     @classmethod
@@ -19,16 +33,39 @@ class ParserFactory:
         parser = cls._parsers.get(extension)
         if not parser:
             raise ValueError(f"No parser found for extension: {extension}")
-        return parser()
+        instance = cls._instances.get(parser)
+        if instance is None:
+            with cls._lock:
+                instance = cls._instances.get(parser)
+                if instance is None:
+                    instance = cls._instances[parser] = cls._load(parser)()
+        return instance
+
+    @staticmethod
+    def _load(parser: Union[str, Type[BaseParser]]) -> Type[BaseParser]:
+        if not isinstance(parser, str):
+            return parser
+        module_name, class_name = parser.split(":")
+        return getattr(importlib.import_module(module_name), class_name)
+
+    @classmethod
+    def preload(cls) -> None:
+        """Create every registered parser up front, logging the ones that
+        can't be created (e.g. OCR parsers without tesseract)"""
+        for extension in cls._parsers:
+            try:
+                cls.get_parser(extension)
+            except Exception as e:
+                logging.error(f"Parser for {extension} unavailable: {e}")
 
 
-ParserFactory.register_parser("txt", TxtParser)
-ParserFactory.register_parser("pdf", PdfParser)
-ParserFactory.register_parser("docx", DocxParser)
-ParserFactory.register_parser("md", MDParser)
-ParserFactory.register_parser("png", ImageParser)
-ParserFactory.register_parser("jpg", ImageParser)
-ParserFactory.register_parser("jpeg", ImageParser)
+ParserFactory.register_parser("txt", "parsers.txt_parser:TxtParser")
+ParserFactory.register_parser("pdf", "parsers.pdf_parser:PdfParser")
+ParserFactory.register_parser("docx", "parsers.docx_parser:DocxParser")
+ParserFactory.register_parser("md", "parsers.md_parser:MDParser")
+ParserFactory.register_parser("png", "parsers.image_parser:ImageParser")
+ParserFactory.register_parser("jpg", "parsers.image_parser:ImageParser")
+ParserFactory.register_parser("jpeg", "parsers.image_parser:ImageParser")
 
 
 # FileParser class
@@ -0,0 +1,142 @@
+import os
+from datetime import timedelta
+from typing import Dict, Optional
+from sqlalchemy import select, update, or_, and_, case, func
+from sqlalchemy.orm import Session
+from db import IngestJob
+
+# A job is retried this many times before it is marked as failed
+INGEST_MAX_ATTEMPTS = int(os.getenv("INGEST_MAX_ATTEMPTS", "3"))
+# How long a worker owns a running job before others may reclaim it. The
+# lease is renewed at every checkpoint, so it only has to cover embedding
+# INGEST_COMMIT_CHUNKS chunks, including rate-limit retries.
+INGEST_JOB_LEASE_SECONDS = int(os.getenv("INGEST_JOB_LEASE_SECONDS", "900"))
+
+
+class LeaseLostError(Exception):
+    """The job's lease expired and another worker reclaimed it"""
+
+
+def _lease_expiry():
+    return func.now() + timedelta(seconds=INGEST_JOB_LEASE_SECONDS)
+
+
+def enqueue(db: Session, file_id: int) -> IngestJob:
+    """Add an ingestion job for a file. The caller commits."""
+    job = IngestJob(file_id=file_id, status="queued", attempts=0)
+    db.add(job)
+    return job
+
+
+def claim_job(db: Session) -> Optional[IngestJob]:
+    """Atomically claim the oldest available job.
+
+    Uses FOR UPDATE SKIP LOCKED so concurrent workers never claim the same
+    job. Jobs left running by a crashed worker become available again once
+    their lease expires, unless they have run out of attempts: a job that
+    keeps crashing its worker is marked as failed instead.
+    """
+    expired = and_(IngestJob.status == "running", IngestJob.locked_until < func.now())
+    db.execute(
+        update(IngestJob)
+        .where(expired, IngestJob.attempts >= INGEST_MAX_ATTEMPTS)
+        .values(
+            status="failed",
+            error="Lease expired on the last attempt",
+            locked_until=None,
+        )
+    )
+    db.commit()
+
+    job = db.scalars(
+        select(IngestJob)
+        .where(
+            or_(
+                IngestJob.status == "queued",
+                and_(expired, IngestJob.attempts < INGEST_MAX_ATTEMPTS),
+            )
+        )
+        .order_by(IngestJob.job_id)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+    ).first()
+    if job is None:
+        db.rollback()
+        return None
+
+    job.status = "running"
+    job.attempts += 1
+    job.locked_until = _lease_expiry()
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def _owned(job_id: int, attempt: int):
+    """The job, if it is still running the given attempt"""
+    return and_(
+        IngestJob.job_id == job_id,
+        IngestJob.status == "running",
+        IngestJob.attempts == attempt,
+    )
+
+
+def complete_job(db: Session, job_id: int, attempt: int) -> bool:
+    """Mark the job as done. False, and nothing changed, if it has been
+    claimed again since attempt (see checkpoint_job)."""
+    done = db.execute(
+        update(IngestJob)
+        .where(_owned(job_id, attempt))
+        .values(status="done", error=None, locked_until=None)
+    ).rowcount
+    db.commit()
+    return bool(done)
+
+
+def checkpoint_job(db: Session, job_id: int, attempt: int, chunks_done: int) -> None:
+    """Record the chunks committed so far and renew the lease. The caller
+    commits, in the same transaction as the chunks.
+
+    attempt is the job's attempts when it was claimed, every claim increments
+    it. Raises LeaseLostError if the job has been claimed again since, so the
+    caller rolls back rather than commit chunks the new owner also stores.
+    """
+    renewed = db.execute(
+        update(IngestJob)
+        .where(_owned(job_id, attempt))
+        .values(chunks_done=chunks_done, locked_until=_lease_expiry())
+    ).rowcount
+    if not renewed:
+        raise LeaseLostError(f"Job {job_id} was reclaimed by another worker")
+
+
+def fail_job(db: Session, job_id: int, attempt: int, error: str) -> bool:
+    """Record a failure and requeue the job unless it ran out of attempts.
+    False, and nothing changed, if it has been claimed again since attempt:
+    the failure is no longer the job's."""
+    failed = db.execute(
+        update(IngestJob)
+        .where(_owned(job_id, attempt))
+        .values(
+            status=case(
+                (IngestJob.attempts >= INGEST_MAX_ATTEMPTS, "failed"),
+                else_="queued",
+            ),
+            error=error,
+            locked_until=None,
+        )
+    ).rowcount
+    db.commit()
+    return bool(failed)
+
+
+def get_job(db: Session, job_id: int) -> Optional[IngestJob]:
+    return db.get(IngestJob, job_id)
+
+
+def queue_depth(db: Session) -> Dict[str, int]:
+    """Number of jobs per status"""
+    rows = db.execute(
+        select(IngestJob.status, func.count()).group_by(IngestJob.status)
+    ).all()
+    return {status: count for status, count in rows}
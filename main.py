@@ -1,24 +1,80 @@
-from fastapi import FastAPI, UploadFile, HTTPException, Depends, BackgroundTasks
+from fastapi import FastAPI, UploadFile, HTTPException, Depends, Request, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse, Response
+from contextlib import asynccontextmanager
+import asyncio
 import os
-import shutil
-import io
-from db import get_db, File, FileChunk
-from sqlalchemy.orm import Session
-from file_parser import FileParser
-from background_tasks import TextProcessor, client as client2
-from sqlalchemy import select
+import json
+import time
+from functools import partial
+from db import SessionLocal, init_db, get_chunks_version, File, DB_INIT_ON_STARTUP
+from async_db import async_engine, get_async_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from parse_pool import parse_pool, ParseError, ParseTimeoutError, ParseCancelledError
+from embedding_cache import (
+    embed_query,
+    embed_queries,
+    query_cache,
+    shared_query_stats,
+    QUERY_EMBEDDING_CACHE_SHARED,
+)
+from embeddings import get_client, OPENAI_API_KEY
+from answer_cache import answer_cache, ANSWER_CACHE_ENABLED
+from vector_cache import vector_cache, VECTOR_CACHE_ENABLED
+from job_queue import enqueue, get_job, queue_depth
+from uploads import save_stream, UploadTooLargeError
+from retrieval import (
+    vector_search,
+    batch_vector_search,
+    hybrid_search,
+    search_chunks,
+    RetrievalMode,
+    RETRIEVAL_TOP_K,
+)
+from context_packing import (
+    pack_context,
+    count_tokens,
+    CONTEXT_MMR_ENABLED,
+    CONTEXT_CANDIDATES,
+)
+from sqlalchemy import select, func
 from pydantic import BaseModel
+from typing import Optional, List
 from dotenv import load_dotenv
-from azure.ai.inference import ChatCompletionsClient
-from azure.ai.inference.models import SystemMessage
-from azure.ai.inference.models import UserMessage
-from azure.core.credentials import AzureKeyCredential
-
-app = FastAPI()
+from chat import create_chat_client, complete, stream_completion
+import metrics
+from metrics import ASK_STAGE_SECONDS, CONTEXT_TOKENS, timed
 
 load_dotenv()
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if DB_INIT_ON_STARTUP:
+        await run_in_threadpool(init_db)
+    # One async chat client per process, reusing its HTTP connection pool
+    app.state.chat_client = create_chat_client()
+    # Import openai and create the embeddings client in the background, so
+    # it doesn't delay startup and the first question doesn't wait for it
+    if OPENAI_API_KEY:
+        asyncio.get_running_loop().run_in_executor(None, get_client)
+    yield
+    if app.state.chat_client is not None:
+        await app.state.chat_client.close()
+    await async_engine.dispose()
+
+
+app = FastAPI(lifespan=lifespan)
+metrics.register_cache("query_embeddings", query_cache)
+metrics.register_cache("document_vectors", vector_cache.documents)
+
+# Uploads larger than this are rejected with 413
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(200 * 1024 * 1024)))
+# Questions per /ask/batch request, and completions in flight per request
+BATCH_ASK_MAX_QUESTIONS = int(os.getenv("BATCH_ASK_MAX_QUESTIONS", "500"))
+BATCH_ASK_CONCURRENCY = int(os.getenv("BATCH_ASK_CONCURRENCY", "8"))
+
+
 class QuestionModel(BaseModel):
     question: str
 
@@ -26,25 +82,69 @@ class QuestionModel(BaseModel):
 class AskModel(BaseModel):
     document_id: int
     question: str
+    # ANN recall knobs, see db.set_search_params
+    ef_search: Optional[int] = None
+    probes: Optional[int] = None
+    # "hybrid" fuses full-text and vector search, see retrieval.hybrid_search
+    retrieval_mode: RetrievalMode = "vector"
+    # Stream the answer as server-sent events
+    stream: bool = False
+
+
+class BatchAskModel(BaseModel):
+    document_id: int
+    questions: List[str]
+    ef_search: Optional[int] = None
+    probes: Optional[int] = None
+    # Completions in flight, capped at BATCH_ASK_CONCURRENCY
+    concurrency: Optional[int] = None
+
+
+class SearchModel(BaseModel):
+    question: str
+    file_ids: Optional[List[int]] = None
+    # Case-insensitive substring match on the file name
+    filename: Optional[str] = None
+    top_k: int = RETRIEVAL_TOP_K
+    # next_cursor from the previous page
+    cursor: Optional[str] = None
+    ef_search: Optional[int] = None
+    probes: Optional[int] = None
 
 
 @app.get("/")
-async def root(db: Session = Depends(get_db)):
-    # Query the database for all files
-    files_query = select(File)
-    files = db.scalars(files_query).all()
+async def root(
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[int] = None,
+    # count(*) reads every row of files, so it is only run on request
+    include_total: bool = False,
+    db: AsyncSession = Depends(get_async_db),
+):
+    # Query only the listed columns, one page at a time in file_id order
+    files_query = select(File.file_id, File.file_name).order_by(File.file_id)
+    if cursor is not None:
+        files_query = files_query.where(File.file_id > cursor)
+    files = (await db.execute(files_query.limit(limit + 1))).all()
+
+    next_cursor = None
+    if len(files) > limit:
+        files = files[:limit]
+        next_cursor = files[-1].file_id
 
     # Format and return the list of files including file_id and filename
     files_list = [
         {"file_id": file.file_id, "file_name": file.file_name} for file in files
     ]
-    return files_list
+    response = {"files": files_list, "next_cursor": next_cursor}
+    if include_total:
+        response["total"] = await db.scalar(select(func.count()).select_from(File))
+    return response
 
 
 @app.post("/uploadfile/")
 async def upload_file(
-    background_tasks: BackgroundTasks, file: UploadFile, db: Session = Depends(get_db)
-):  
+    request: Request, file: UploadFile, db: AsyncSession = Depends(get_async_db)
+):
     # Define allowed file extensions
     allowed_extensions = ["txt", "pdf", "docx", "md", "png", "jpg", "jpeg"]
 
@@ -53,110 +153,460 @@ async def upload_file(
     if file_extension not in allowed_extensions:
         raise HTTPException(status_code=400, detail="File type not allowed")
 
+    # Reject oversized uploads up front when the client declares the size
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit():
+        if int(content_length) > MAX_UPLOAD_BYTES + 64 * 1024:
+            raise HTTPException(status_code=413, detail="File too large")
+
     # Create the folder if it doesn't exist
     folder = "sources"
     try:
         # Ensure the directory exists
         os.makedirs(folder, exist_ok=True)
 
-        # Secure way to save the file
-        file_location = os.path.join(folder, file.filename)
-        file_content = await file.read()  # Read file content as bytes
-        with open(file_location, "wb+") as file_object:
-            # Convert bytes content to a file-like object
-            file_like_object = io.BytesIO(file_content)
-            # Use shutil.copyfileobj for secure file writing
-            shutil.copyfileobj(file_like_object, file_object)
-
-        content_parser = FileParser(file_location)
-        file_text_content = content_parser.parse()
-
-        # save file details in the database
-        new_file = File(file_name=file.filename, file_content=file_text_content)
+        # Stream the file to disk in fixed-size blocks, off the event loop,
+        # so memory use does not depend on the upload size. It is stored
+        # under its content hash, so same-name uploads don't collide.
+        try:
+            file_location, file_size, content_hash = await run_in_threadpool(
+                save_stream, file.file, folder, file_extension, MAX_UPLOAD_BYTES
+            )
+        except UploadTooLargeError as e:
+            raise HTTPException(status_code=413, detail=str(e))
+
+        # Parse in a separate process so the event loop stays responsive,
+        # the parse is killed if the client goes away
+        try:
+            file_text_content = await parse_pool.parse(
+                file_location, request.is_disconnected
+            )
+        except ParseTimeoutError as e:
+            raise HTTPException(status_code=504, detail=str(e))
+        except ParseCancelledError as e:
+            print(f"Upload cancelled: {e}")
+            raise HTTPException(status_code=499, detail="Client disconnected")
+        except ParseError as e:
+            raise HTTPException(status_code=422, detail=f"Error parsing file: {e}")
+
+        # save file details and queue it for chunking and embedding in one
+        # transaction, the worker pool (worker.py) picks the job up
+        new_file = File(
+            file_name=file.filename,
+            file_content=file_text_content,
+            content_hash=content_hash,
+        )
         db.add(new_file)
-        db.commit()
-        db.refresh(new_file)
-
-        # Add background job for processing file content
-        background_tasks.add_task(
-            TextProcessor(db, new_file.file_id).chunk_and_embed, file_text_content
-        )  
-
-        return {"message": "File saved", "filename": file.filename}
-
+        await db.flush()
+        job = enqueue(db, new_file.file_id)
+        await db.commit()
+
+        return {
+            "message": "File saved",
+            "filename": file.filename,
+            "file_id": new_file.file_id,
+            "job_id": job.job_id,
+            "size": file_size,
+            "content_hash": content_hash,
+        }
+
+    except HTTPException:
+        raise
     except Exception as e:
         # Log the exception (add actual logging in production code)
         print(f"Error saving file: {e}")
         raise HTTPException(status_code=500, detail="Error saving file")
 
 
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: int, db: AsyncSession = Depends(get_async_db)):
+    job = await db.run_sync(get_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {
+        "job_id": job.job_id,
+        "file_id": job.file_id,
+        "status": job.status,
+        "attempts": job.attempts,
+        "chunks_done": job.chunks_done,
+        "error": job.error,
+        "created_at": job.created_at,
+        "updated_at": job.updated_at,
+    }
+
+
+@app.get("/cache/stats")
+async def cache_stats():
+    return {
+        "query_embeddings": query_cache.stats(),
+        "query_embeddings_shared": shared_query_stats.stats(),
+        "answers": answer_cache.stats(),
+        "document_vectors": vector_cache.stats(),
+    }
+
+
+@app.get("/metrics")
+async def prometheus_metrics(db: AsyncSession = Depends(get_async_db)):
+    if not metrics.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    # Queue depth is sampled here rather than tracked by every worker
+    depth = await db.run_sync(queue_depth)
+    for status in ("queued", "running", "done", "failed"):
+        metrics.INGEST_QUEUE_DEPTH.labels(status=status).set(depth.get(status, 0))
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
+def _embed_with_session(embed, questions):
+    # The shared query embedding cache needs a (sync) session
+    if not QUERY_EMBEDDING_CACHE_SHARED:
+        return embed(questions)
+    with SessionLocal() as db:
+        return embed(questions, db)
+
+
+async def embed_question(question: str) -> list:
+    """embed_query in the threadpool, so the API call doesn't block the loop"""
+    return await run_in_threadpool(_embed_with_session, embed_query, question)
+
+
+async def embed_questions(questions: List[str]) -> List[list]:
+    return await run_in_threadpool(_embed_with_session, embed_queries, questions)
+
+
+def _cached_search(file_id: int, version: int, embeddings: List[list], limit: int):
+    """vector_cache.search, loading hot documents through a sync session.
+    Run in the threadpool: the search and loads are CPU-bound."""
+    with SessionLocal() as db:
+        return vector_cache.search(db, file_id, version, embeddings, limit)
+
+
 # Function to get similar chunks
-async def get_similar_chunks(file_id: int, question: str, db: Session):
+async def get_similar_chunks(
+    file_id: int,
+    question: str,
+    db: AsyncSession,
+    ef_search: Optional[int] = None,
+    probes: Optional[int] = None,
+    retrieval_mode: RetrievalMode = "vector",
+    question_embedding: Optional[list] = None,
+    limit: int = RETRIEVAL_TOP_K,
+    version: Optional[int] = None,
+):
+    """version is the document's chunks_version, if known. With it, vector
+    retrieval on hot documents is served from the in-process vector cache."""
     try:
-        # Create embeddings for the question (assuming client and embedding creation logic)
-        response = client2.embeddings.create(
-            input=question, model="text-embedding-3-small"
-        )
-        question_embedding = response.data[0].embedding
+        # Embed the question, repeated questions are served from the cache
+        if question_embedding is None:
+            with timed(ASK_STAGE_SECONDS, stage="embed", mode=retrieval_mode):
+                question_embedding = await embed_question(question)
+
+        with timed(ASK_STAGE_SECONDS, stage="retrieval", mode=retrieval_mode):
+            if retrieval_mode == "hybrid":
+                return await db.run_sync(
+                    hybrid_search,
+                    file_id,
+                    question,
+                    question_embedding,
+                    limit=limit,
+                    ef_search=ef_search,
+                    probes=probes,
+                )
+            if VECTOR_CACHE_ENABLED and version is not None:
+                cached = await run_in_threadpool(
+                    _cached_search, file_id, version, [question_embedding], limit
+                )
+                if cached is not None:
+                    return cached[0]
+            return await db.run_sync(
+                vector_search,
+                file_id,
+                question_embedding,
+                limit=limit,
+                ef_search=ef_search,
+                probes=probes,
+            )
 
-        similar_chunks_query = (
-            select(FileChunk)
-            .where(FileChunk.file_id == file_id)
-            .order_by(FileChunk.embedding_vector.l2_distance(question_embedding))
-            .limit(10)
-        )
-        similar_chunks = db.scalars(similar_chunks_query).all()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-        return similar_chunks
 
+@app.post("/search/")
+async def search(request: SearchModel, db: AsyncSession = Depends(get_async_db)):
+    try:
+        with timed(ASK_STAGE_SECONDS, stage="embed", mode="search"):
+            question_embedding = await embed_question(request.question)
+        with timed(ASK_STAGE_SECONDS, stage="retrieval", mode="search"):
+            rows, next_cursor = await db.run_sync(
+                search_chunks,
+                question_embedding,
+                top_k=request.top_k,
+                file_ids=request.file_ids,
+                filename=request.filename,
+                cursor=request.cursor,
+                ef_search=request.ef_search,
+                probes=request.probes,
+            )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+    return {
+        "results": [
+            {
+                "chunk_id": row.chunk_id,
+                "file_id": row.file_id,
+                "file_name": row.file_name,
+                "chunk_text": row.chunk_text,
+                "distance": row.distance,
+            }
+            for row in rows
+        ],
+        "next_cursor": next_cursor,
+    }
 
-@app.post("/ask/")
-async def ask_question(request: AskModel, db: Session = Depends(get_db)):
-    TOKEN = os.getenv("GITHUB_TOKEN")
 
-    client = ChatCompletionsClient(
-        endpoint="https://models.inference.ai.azure.com",
-        credential=AzureKeyCredential(TOKEN),
-    )
+@app.post("/ask/")
+async def ask_question(request: AskModel, db: AsyncSession = Depends(get_async_db)):
+    client = app.state.chat_client
 
-    if TOKEN is None:
+    if client is None:
         raise HTTPException(status_code=500, detail="TOKEN not found")
     try:
+        mode = request.retrieval_mode
+        with timed(ASK_STAGE_SECONDS, stage="embed", mode=mode):
+            question_embedding = await embed_question(request.question)
+
+        # Paraphrases of a question answered before on the same, unchanged
+        # document skip retrieval and the completion
+        store_answer = None
+        version = None
+        if ANSWER_CACHE_ENABLED or (VECTOR_CACHE_ENABLED and mode == "vector"):
+            version = await db.run_sync(get_chunks_version, request.document_id)
+        if ANSWER_CACHE_ENABLED and version is not None:
+            cached = answer_cache.get(
+                request.document_id, mode, version, question_embedding
+            )
+            if cached is not None:
+                if request.stream:
+                    return StreamingResponse(
+                        _cached_answer_events(cached),
+                        media_type="text/event-stream",
+                    )
+                return {"response": cached}
+            store_answer = partial(
+                answer_cache.set,
+                request.document_id,
+                mode,
+                version,
+                question_embedding,
+            )
+
         similar_chunks = await get_similar_chunks(
-            request.document_id, request.question, db
+            request.document_id,
+            request.question,
+            db,
+            ef_search=request.ef_search,
+            probes=request.probes,
+            retrieval_mode=mode,
+            question_embedding=question_embedding,
+            limit=CONTEXT_CANDIDATES if CONTEXT_MMR_ENABLED else RETRIEVAL_TOP_K,
+            version=version,
         )
+        # Done with the database: return the connection to the pool rather
+        # than hold it for the whole completion
+        await db.close()
+
+        # Construct context from the similar chunks' texts, without
+        # near-duplicates and within the token budget
+        if CONTEXT_MMR_ENABLED:
+            with timed(ASK_STAGE_SECONDS, stage="rerank", mode=mode):
+                packed = await run_in_threadpool(
+                    pack_context, question_embedding, similar_chunks, RETRIEVAL_TOP_K
+                )
+            context = packed.text
+            CONTEXT_TOKENS.labels(mode=mode).observe(packed.tokens)
+        else:
+            context = " ".join(chunk.chunk_text for chunk in similar_chunks)
+            if metrics.METRICS_ENABLED:
+                CONTEXT_TOKENS.labels(mode=mode).observe(count_tokens(context))
+
+        if request.stream:
+            return StreamingResponse(
+                _stream_answer(client, context, request.question, mode, store_answer),
+                media_type="text/event-stream",
+            )
+
+        # Call the completion endpoint with the context and user question
+        start = time.perf_counter()
+        with timed(ASK_STAGE_SECONDS, stage="completion", mode=mode):
+            response = await complete(client, context, request.question)
+        if store_answer is not None:
+            store_answer(response, time.perf_counter() - start)
+
+        return {"response": response}
 
-        # Construct context from the similar chunks' texts
-        context_texts = [chunk.chunk_text for chunk in similar_chunks]
-        context = " ".join(context_texts)
-
-        # Update the system message with the context
-        system_message = (
-            f"You are an assistant designed to provide accurate and helpful responses strictly based on the given context. "
-            f"If a user's question is not addressed by the provided context, respond with: "
-            f"`I'm sorry, I don't have relevant information on that!` "
-            f"Do not mention that you have been provided with the context."
-            f"Here is the context for your responses: {context}"
-        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-        # Call the completion endpoint with the system message and user question
-        response = client.complete(
-            messages=[
-                SystemMessage(content=system_message),
-                UserMessage(content=request.question),
-            ],
-            model="Mistral-large-2407",
-            temperature=0.8,
-            max_tokens=4096,
-            top_p=0.1,
-        )
 
-        return {"response": response.choices[0].message.content}
+@app.post("/ask/batch/")
+async def ask_batch(request: BatchAskModel, db: AsyncSession = Depends(get_async_db)):
+    """Answer many questions about one document.
+
+    The questions are embedded in one API request and their chunks retrieved
+    in one query. Answers are streamed as newline-delimited JSON objects
+    with the index of the question, in the order they finish.
+    """
+    client = app.state.chat_client
+
+    if client is None:
+        raise HTTPException(status_code=500, detail="TOKEN not found")
+    if len(request.questions) > BATCH_ASK_MAX_QUESTIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {BATCH_ASK_MAX_QUESTIONS} questions per request",
+        )
+    try:
+        with timed(ASK_STAGE_SECONDS, stage="embed", mode="batch"):
+            embeddings = await embed_questions(request.questions)
+
+        # Batches use vector retrieval, so answers are shared with /ask
+        cached, store_answers = {}, {}
+        version = None
+        if ANSWER_CACHE_ENABLED or VECTOR_CACHE_ENABLED:
+            version = await db.run_sync(get_chunks_version, request.document_id)
+        for index, embedding in enumerate(embeddings):
+            if not ANSWER_CACHE_ENABLED or version is None:
+                break
+            answer = answer_cache.get(request.document_id, "vector", version, embedding)
+            if answer is not None:
+                cached[index] = answer
+            else:
+                store_answers[index] = partial(
+                    answer_cache.set, request.document_id, "vector", version, embedding
+                )
+
+        pending = [i for i in range(len(request.questions)) if i not in cached]
+        limit = CONTEXT_CANDIDATES if CONTEXT_MMR_ENABLED else RETRIEVAL_TOP_K
+        with timed(ASK_STAGE_SECONDS, stage="retrieval", mode="batch"):
+            similar_chunks = None
+            if VECTOR_CACHE_ENABLED and version is not None and pending:
+                similar_chunks = await run_in_threadpool(
+                    _cached_search,
+                    request.document_id,
+                    version,
+                    [embeddings[i] for i in pending],
+                    limit,
+                )
+            if similar_chunks is None:
+                similar_chunks = await db.run_sync(
+                    batch_vector_search,
+                    request.document_id,
+                    [embeddings[i] for i in pending],
+                    limit=limit,
+                    ef_search=request.ef_search,
+                    probes=request.probes,
+                )
+        # The completions are streamed after this returns, don't hold a
+        # connection for them
+        await db.close()
+
+        with timed(ASK_STAGE_SECONDS, stage="rerank", mode="batch"):
+            contexts = await run_in_threadpool(
+                _build_contexts, pending, embeddings, similar_chunks
+            )
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+    concurrency = min(
+        request.concurrency or BATCH_ASK_CONCURRENCY, BATCH_ASK_CONCURRENCY
+    )
+    return StreamingResponse(
+        _batch_answers(
+            client,
+            request.questions,
+            cached,
+            contexts,
+            store_answers,
+            max(concurrency, 1),
+        ),
+        media_type="application/x-ndjson",
+    )
+
+
+def _build_contexts(pending: List[int], embeddings: List[list], similar_chunks):
+    """Context for each pending question, by index"""
+    contexts = {}
+    for index, chunks in zip(pending, similar_chunks):
+        if CONTEXT_MMR_ENABLED:
+            packed = pack_context(embeddings[index], chunks, RETRIEVAL_TOP_K)
+            contexts[index] = packed.text
+            CONTEXT_TOKENS.labels(mode="batch").observe(packed.tokens)
+        else:
+            contexts[index] = " ".join(chunk.chunk_text for chunk in chunks)
+    return contexts
+
+
+async def _batch_answers(
+    client,
+    questions: List[str],
+    cached: dict,
+    contexts: dict,
+    store_answers: dict,
+    concurrency: int,
+):
+    """Yield cached answers, then completions as they finish"""
+    for index, answer in cached.items():
+        yield json.dumps({"index": index, "response": answer}) + "\n"
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def answer(index: int) -> dict:
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                with timed(ASK_STAGE_SECONDS, stage="completion", mode="batch"):
+                    response = await complete(client, contexts[index], questions[index])
+            except Exception as e:
+                return {"index": index, "error": str(e)}
+        if index in store_answers:
+            store_answers[index](response, time.perf_counter() - start)
+        return {"index": index, "response": response}
+
+    tasks = [asyncio.create_task(answer(index)) for index in contexts]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield json.dumps(await next_done) + "\n"
+    finally:
+        # The client went away, don't keep paying for its completions
+        for task in tasks:
+            task.cancel()
+
+
+async def _stream_answer(
+    client, context: str, question: str, mode: str, store_answer=None
+):
+    """Forward answer tokens as server-sent events as they arrive.
+
+    The complete answer is passed to store_answer, if given, with the time
+    it took.
+    """
+    try:
+        pieces = []
+        start = time.perf_counter()
+        with timed(ASK_STAGE_SECONDS, stage="completion", mode=mode):
+            async for content in stream_completion(client, context, question):
+                pieces.append(content)
+                yield f"data: {json.dumps({'content': content})}\n\n"
+        if store_answer is not None:
+            store_answer("".join(pieces), time.perf_counter() - start)
+        yield "data: [DONE]\n\n"
+    except Exception as e:
+        yield f"event: error\ndata: {json.dumps({'detail': str(e)})}\n\n"
+
 
+async def _cached_answer_events(answer: str):
+    yield f"data: {json.dumps({'content': answer})}\n\n"
+    yield "data: [DONE]\n\n"
@@ -0,0 +1,301 @@
+"""Prometheus metrics for the ingest and ask paths.
+
+Enabled with METRICS_ENABLED=true, which requires prometheus_client. When
+disabled every metric is a no-op and the timers skip the clock calls, so
+instrumented code costs a function call per stage.
+
+The API and the ingest workers run in separate processes. To collect the
+worker metrics on the API's /metrics endpoint, point PROMETHEUS_MULTIPROC_DIR
+at a directory shared by all of them (and empty it on deploy), as described
+in the prometheus_client documentation.
+"""
+
+import os
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Callable, Iterable, Iterator, Optional
+from dotenv import load_dotenv
+
+try:
+    import prometheus_client
+    from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+except ImportError:  # Metrics are optional
+    prometheus_client = None
+
+load_dotenv()
+
+METRICS_ENABLED = (
+    os.getenv("METRICS_ENABLED", "false").lower() == "true"
+    and prometheus_client is not None
+)
+MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+# Upper bounds of the size label, in bytes
+SIZE_BUCKETS = (
+    (100 * 1024, "<=100KB"),
+    (1024 * 1024, "<=1MB"),
+    (10 * 1024 * 1024, "<=10MB"),
+)
+# Histogram buckets in seconds, from a single query to a large OCR job
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+# Histogram buckets for the context passed to the model, in tokens
+TOKEN_BUCKETS = (250, 500, 1000, 1500, 2000, 3000, 4000, 6000, 8000)
+
+
+def size_bucket(num_bytes: int) -> str:
+    for limit, label in SIZE_BUCKETS:
+        if num_bytes <= limit:
+            return label
+    return ">10MB"
+
+
+def parser_label(file_name: Optional[str]) -> str:
+    if not file_name or "." not in file_name:
+        return "unknown"
+    return file_name.rsplit(".", 1)[-1].lower()
+
+
+class _NoopMetric:
+    def labels(self, *args, **kwargs):
+        return self
+
+    def observe(self, value):
+        pass
+
+    def inc(self, amount=1):
+        pass
+
+    def dec(self, amount=1):
+        pass
+
+    def set(self, value):
+        pass
+
+
+def _histogram(name, documentation, labelnames, buckets=STAGE_BUCKETS):
+    if not METRICS_ENABLED:
+        return _NoopMetric()
+    return prometheus_client.Histogram(name, documentation, labelnames, buckets=buckets)
+
+
+def _counter(name, documentation, labelnames):
+    if not METRICS_ENABLED:
+        return _NoopMetric()
+    return prometheus_client.Counter(name, documentation, labelnames)
+
+
+def _gauge(name, documentation, labelnames, multiprocess_mode="livesum"):
+    if not METRICS_ENABLED:
+        return _NoopMetric()
+    return prometheus_client.Gauge(
+        name, documentation, labelnames, multiprocess_mode=multiprocess_mode
+    )
+
+
+INGEST_STAGE_SECONDS = _histogram(
+    "rag_ingest_stage_seconds",
+    "Time spent per document in each ingest stage",
+    ["stage", "parser", "size"],
+)
+ASK_STAGE_SECONDS = _histogram(
+    "rag_ask_stage_seconds",
+    "Time spent per request in each stage of /ask and /search",
+    ["stage", "mode"],
+)
+API_REQUEST_SECONDS = _histogram(
+    "rag_api_request_seconds",
+    "Latency of embeddings and chat completion API calls",
+    ["api"],
+)
+API_IN_FLIGHT = _gauge(
+    "rag_api_in_flight", "Embeddings and chat API calls in flight", ["api"]
+)
+API_CONCURRENCY_LIMIT = _gauge(
+    "rag_api_concurrency_limit",
+    "Adaptive limit on API calls in flight, see rate_limit.AdaptiveLimiter",
+    ["api"],
+)
+API_RATE_LIMITED = _counter(
+    "rag_api_rate_limited_total",
+    "API calls answered with a rate-limit or overload error",
+    ["api"],
+)
+INGEST_QUEUE_DEPTH = _gauge(
+    "rag_ingest_queue_depth",
+    "Ingest jobs by status, sampled when /metrics is scraped",
+    ["status"],
+    multiprocess_mode="max",
+)
+CONTEXT_TOKENS = _histogram(
+    "rag_context_tokens",
+    "Tokens of retrieved context passed to the model per /ask request",
+    ["mode"],
+    buckets=TOKEN_BUCKETS,
+)
+ANSWER_CACHE_SAVED_SECONDS = _counter(
+    "rag_answer_cache_saved_seconds",
+    "Completion time saved by answers served from the answer cache",
+    [],
+)
+CACHE_REQUESTS = _counter(
+    "rag_cache_requests_total", "Cache lookups by cache and result", ["cache", "result"]
+)
+
+
+@contextmanager
+def timed(histogram, **labels):
+    """Observe the duration of the block in histogram"""
+    if not METRICS_ENABLED:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.labels(**labels).observe(time.perf_counter() - start)
+
+
+@contextmanager
+def in_flight(api: str):
+    """Count an external API call as in flight and observe its latency"""
+    if not METRICS_ENABLED:
+        yield
+        return
+    gauge = API_IN_FLIGHT.labels(api=api)
+    gauge.inc()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        gauge.dec()
+        API_REQUEST_SECONDS.labels(api=api).observe(time.perf_counter() - start)
+
+
+class StageTimer:
+    """Accumulate time per stage for one unit of work, observed once.
+
+    Stages nest and are timed exclusively: while an inner stage runs the
+    outer one is paused. This separates stages that are interleaved through
+    generators, e.g. chunking that runs inside the embedding loop.
+    """
+
+    def __init__(self, histogram, **labels):
+        self.histogram = histogram
+        self.labels = labels
+        self.totals = defaultdict(float)
+        self._stack = []
+        self._started = 0.0
+
+    def _switch(self) -> None:
+        now = time.perf_counter()
+        if self._stack:
+            self.totals[self._stack[-1]] += now - self._started
+        self._started = now
+
+    @contextmanager
+    def stage(self, name: str):
+        if not METRICS_ENABLED:
+            yield
+            return
+        self._switch()
+        self._stack.append(name)
+        try:
+            yield
+        finally:
+            self._switch()
+            self._stack.pop()
+
+    def iter(self, name: str, iterable: Iterable) -> Iterator:
+        """Time each step of iterable as stage name"""
+        if not METRICS_ENABLED:
+            return iter(iterable)
+        return self._timed_iter(name, iter(iterable))
+
+    def _timed_iter(self, name, iterator):
+        while True:
+            with self.stage(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def wrap(self, name: str, func: Callable) -> Callable:
+        """Time each call of func as stage name"""
+        if not METRICS_ENABLED:
+            return func
+
+        def timed_func(*args, **kwargs):
+            with self.stage(name):
+                return func(*args, **kwargs)
+
+        return timed_func
+
+    def observe(self) -> None:
+        for name, seconds in self.totals.items():
+            self.histogram.labels(stage=name, **self.labels).observe(seconds)
+
+
+class _CacheCollector:
+    """Export the counters of in-process caches (cache.LRUCache)"""
+
+    def __init__(self):
+        self.caches = {}
+
+    def collect(self):
+        entries = GaugeMetricFamily(
+            "rag_cache_entries", "Entries held by in-process caches", labels=["cache"]
+        )
+        size = GaugeMetricFamily(
+            "rag_cache_size",
+            "Size of in-process caches in their units",
+            labels=["cache"],
+        )
+        lookups = CounterMetricFamily(
+            "rag_cache_lookups",
+            "Lookups in in-process caches by result",
+            labels=["cache", "result"],
+        )
+        evictions = CounterMetricFamily(
+            "rag_cache_evictions", "Evictions from in-process caches", labels=["cache"]
+        )
+        for name, cache in self.caches.items():
+            entries.add_metric([name], len(cache))
+            size.add_metric([name], cache.size)
+            lookups.add_metric([name, "hit"], cache.hits)
+            lookups.add_metric([name, "miss"], cache.misses)
+            evictions.add_metric([name], cache.evictions)
+        yield from (entries, size, lookups, evictions)
+
+
+_cache_collector = None
+if METRICS_ENABLED:
+    _cache_collector = _CacheCollector()
+    if not MULTIPROC_DIR:
+        prometheus_client.REGISTRY.register(_cache_collector)
+
+
+def register_cache(name: str, cache) -> None:
+    """Export an in-process LRUCache of this process under /metrics"""
+    if _cache_collector is not None:
+        _cache_collector.caches[name] = cache
+
+
+def render() -> bytes:
+    """Metrics in the Prometheus text format"""
+    if not MULTIPROC_DIR:
+        return prometheus_client.generate_latest()
+    # Aggregate the metric files written by every process, plus the caches
+    # of this one
+    from prometheus_client import multiprocess
+
+    registry = prometheus_client.CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    registry.register(_cache_collector)
+    return prometheus_client.generate_latest(registry)
+
+
+CONTENT_TYPE = (
+    prometheus_client.CONTENT_TYPE_LATEST if prometheus_client is not None else None
+)
@@ -1,11 +0,0 @@
-#!/bin/bash
-
-echo "Installing NLTK data..."
-
-python << EOF
-import nltk
-nltk.download('punkt')
-nltk.download('punkt_tab')
-EOF
-
-echo "NLTK data installed."
\ No newline at end of file
@@ -0,0 +1,163 @@
+"""Run FileParser off the event loop, in separate processes.
+
+Each parse runs in its own child process forked from a forkserver that has
+the parsers created (see parsers/preload.py), so a parse can be killed on
+timeout or when the client disconnects, and a memory cap applies only to
+that parse. The number of concurrent parses is bounded by PARSE_WORKERS.
+"""
+
+import asyncio
+import multiprocessing
+import os
+import time
+from typing import Awaitable, Callable, Optional
+from dotenv import load_dotenv
+from file_parser import FileParser
+from parsers import ocr_budget
+from metrics import INGEST_STAGE_SECONDS, timed, size_bucket
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+load_dotenv()
+
+# Maximum number of files parsed at the same time
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", str(os.cpu_count() or 1)))
+# Default timeout in seconds, override per type with e.g. PARSE_TIMEOUT_PDF
+PARSE_TIMEOUT = float(os.getenv("PARSE_TIMEOUT", "300"))
+# Address space limit for a parser process, 0 disables the limit
+PARSE_MEMORY_LIMIT_MB = int(os.getenv("PARSE_MEMORY_LIMIT_MB", "2048"))
+# How often to check for client disconnects while a parse is running
+PARSE_POLL_INTERVAL = 0.1
+
+if "forkserver" in multiprocessing.get_all_start_methods():
+    _context = multiprocessing.get_context("forkserver")
+    _context.set_forkserver_preload(["parsers.preload"])
+else:
+    _context = multiprocessing.get_context("spawn")
+
+
+class ParseError(Exception):
+    pass
+
+
+class ParseTimeoutError(ParseError):
+    pass
+
+
+class ParseCancelledError(ParseError):
+    pass
+
+
+def parse_timeout(extension: str) -> float:
+    return float(os.getenv(f"PARSE_TIMEOUT_{extension.upper()}", PARSE_TIMEOUT))
+
+
+def _parse_in_child(filepath: str, memory_limit_mb: int, ocr_workers, conn) -> None:
+    ocr_budget.use(ocr_workers)
+    if memory_limit_mb and resource is not None:
+        limit = memory_limit_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    try:
+        conn.send((True, FileParser(filepath).parse()))
+    except BaseException as e:
+        conn.send((False, f"{type(e).__name__}: {e}"))
+    finally:
+        conn.close()
+
+
+class ParsePool:
+    def __init__(
+        self,
+        max_workers: int = PARSE_WORKERS,
+        memory_limit_mb: int = PARSE_MEMORY_LIMIT_MB,
+    ):
+        self.memory_limit_mb = memory_limit_mb
+        self._slots = asyncio.Semaphore(max_workers)
+        # Shared by the parses running at the same time. Created on the first
+        # parse: parse processes import this module too.
+        self._ocr_workers = None
+
+    async def parse(
+        self,
+        filepath: str,
+        is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None,
+    ) -> str:
+        """Parse a file in a child process.
+
+        Raises ParseTimeoutError if the per-type timeout is exceeded and
+        ParseCancelledError if is_disconnected() reports that the client
+        went away. In both cases the child process is killed.
+        """
+        extension = filepath.split(".")[-1]
+        timeout = parse_timeout(extension)
+        size = size_bucket(os.path.getsize(filepath))
+        if self._ocr_workers is None:
+            self._ocr_workers = ocr_budget.create(_context)
+        async with self._slots:
+            with timed(
+                INGEST_STAGE_SECONDS,
+                stage="parse",
+                parser=extension.lower(),
+                size=size,
+            ):
+                parent_conn, child_conn = _context.Pipe(duplex=False)
+                process = _context.Process(
+                    target=_parse_in_child,
+                    args=(
+                        filepath,
+                        self.memory_limit_mb,
+                        self._ocr_workers,
+                        child_conn,
+                    ),
+                )
+                process.start()
+                child_conn.close()
+                # Receiving a large text and waiting for the process to
+                # exit block, so they run in a thread
+                loop = asyncio.get_running_loop()
+                try:
+                    await self._wait_for_result(
+                        parent_conn, timeout, is_disconnected, filepath
+                    )
+                    try:
+                        ok, result = await loop.run_in_executor(None, parent_conn.recv)
+                    except EOFError:
+                        await loop.run_in_executor(None, process.join)
+                        raise ParseError(
+                            f"Parser process exited with code {process.exitcode}"
+                        )
+                    if not ok:
+                        raise ParseError(result)
+                    return result
+                finally:
+                    if process.is_alive():
+                        process.kill()
+                    await loop.run_in_executor(None, process.join)
+                    parent_conn.close()
+
+    async def _wait_for_result(self, conn, timeout, is_disconnected, filepath):
+        loop = asyncio.get_running_loop()
+        ready = loop.create_future()
+        loop.add_reader(conn.fileno(), lambda: ready.done() or ready.set_result(None))
+        deadline = time.monotonic() + timeout
+        try:
+            while True:
+                done, _ = await asyncio.wait({ready}, timeout=PARSE_POLL_INTERVAL)
+                if done:
+                    return
+                if time.monotonic() > deadline:
+                    raise ParseTimeoutError(
+                        f"Parsing {filepath} timed out after {timeout}s"
+                    )
+                if is_disconnected is not None and await is_disconnected():
+                    raise ParseCancelledError(
+                        f"Client disconnected while parsing {filepath}"
+                    )
+        finally:
+            loop.remove_reader(conn.fileno())
+
+
+parse_pool = ParsePool()
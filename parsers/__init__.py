@@ -1,8 +1,21 @@
 # parsers/__init__.py
-from .txt_parser import TxtParser
-from .pdf_parser import PdfParser
-from .docx_parser import DocxParser
-from .md_parser import MDParser
-from .image_parser import ImageParser
+# Parsers are imported on first access, so importing the package doesn't
+# load fitz, python-docx, pytesseract, PIL, markdown and bs4
+import importlib
 
-__all__ = ["TxtParser", "PdfParser", "DocxParser", "MDParser", "ImageParser"]
+_PARSER_MODULES = {
+    "TxtParser": ".txt_parser",
+    "PdfParser": ".pdf_parser",
+    "DocxParser": ".docx_parser",
+    "MDParser": ".md_parser",
+    "ImageParser": ".image_parser",
+}
+
+__all__ = list(_PARSER_MODULES)
+
+
+def __getattr__(name):
+    if name in _PARSER_MODULES:
+        module = importlib.import_module(_PARSER_MODULES[name], __name__)
+        return getattr(module, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
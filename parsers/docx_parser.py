@@ -4,12 +4,13 @@ import io
 import pytesseract
 from PIL import Image
 import docx
-from .pdf_parser import PdfParser
+from .tesseract import verify_tesseract
 from docx.document import Document
 
+
 class DocxParser(BaseParser):
     def __init__(self):
-        if not PdfParser._verify_tesseract():
+        if not verify_tesseract():
             raise RuntimeError("Tesseract OCR is not properly installed")
 
     def parse(self, filepath: str) -> str:
@@ -2,12 +2,12 @@ from .base_parser import BaseParser
 import logging
 import pytesseract
 from PIL import Image
-from .pdf_parser import PdfParser
+from .tesseract import verify_tesseract
 
 
 class ImageParser(BaseParser):
     def __init__(self):
-        if not PdfParser._verify_tesseract():
+        if not verify_tesseract():
             raise RuntimeError("Tesseract OCR is not properly installed")
 
     def parse(self, filepath: str) -> str:
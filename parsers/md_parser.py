@@ -2,12 +2,16 @@ from .base_parser import BaseParser
 import logging
 import markdown
 import re
+import threading
 from bs4 import BeautifulSoup
 from typing import List, Optional
 
 
 class MDParser(BaseParser):
     def __init__(self):
+        # The converter is built once and reused. It keeps per-document
+        # state, so conversions are serialized and it is reset after each one
+        self._md_lock = threading.Lock()
         self.md = markdown.Markdown(
             extensions=[
                 "fenced_code",  # Code blocks
@@ -29,7 +33,11 @@ class MDParser(BaseParser):
                 content = self._preprocess_markdown(file.read())
 
             # Convert to HTML
-            html = self.md.convert(content)
+            with self._md_lock:
+                try:
+                    html = self.md.convert(content)
+                finally:
+                    self.md.reset()
             soup = BeautifulSoup(html, "html.parser")
 
             processed_content = []
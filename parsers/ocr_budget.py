@@ -0,0 +1,45 @@
+"""OCR processes shared by the parses running in separate processes.
+
+Scanned PDF pages are OCR'd by a pool of processes per document. Documents
+are parsed in processes of their own (see parse_pool.py and bulk_ingest.py),
+which all draw their OCR processes from one budget of PDF_OCR_WORKERS. A lone
+parse uses all of them, concurrent parses split them.
+"""
+
+import multiprocessing
+import os
+from contextlib import contextmanager
+from typing import Iterator
+
+# Processes used to OCR scanned pages, across all the documents parsed at once
+PDF_OCR_WORKERS = int(os.getenv("PDF_OCR_WORKERS", str(os.cpu_count() or 1)))
+
+# Set by use() in parse processes
+_budget = None
+
+
+def create(context=multiprocessing):
+    """A budget for the parse processes, which each call use() with it"""
+    return context.Value("i", PDF_OCR_WORKERS)
+
+
+def use(budget) -> None:
+    global _budget
+    _budget = budget
+
+
+@contextmanager
+def reserve(wanted: int) -> Iterator[int]:
+    """Reserve up to wanted OCR processes, and at least one so a parse never
+    waits for another. Without a shared budget, all of them."""
+    if _budget is None:
+        yield wanted
+        return
+    with _budget.get_lock():
+        reserved = max(1, min(wanted, _budget.value))
+        _budget.value -= reserved
+    try:
+        yield reserved
+    finally:
+        with _budget.get_lock():
+            _budget.value += reserved
@@ -1,23 +1,57 @@
 from .base_parser import BaseParser
 import logging
-import PyPDF2
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 import pytesseract
 import fitz
 from PIL import Image
+from .tesseract import verify_tesseract
+from . import ocr_budget
+from .ocr_budget import PDF_OCR_WORKERS
+
+# Resolution used to render scanned pages for OCR
+PDF_OCR_DPI = int(os.getenv("PDF_OCR_DPI", "300"))
+# Pages with less extractable text than this are OCR'd instead
+PDF_MIN_PAGE_TEXT_CHARS = int(os.getenv("PDF_MIN_PAGE_TEXT_CHARS", "20"))
+
+# Document opened once per OCR worker process
+_worker_doc = None
+
+
+def _open_document(filepath: str):
+    doc = fitz.open(filepath)
+    if doc.needs_pass and not doc.authenticate(""):
+        doc.close()
+        raise ValueError("Unable to decrypt PDF")
+    return doc
+
+
+def _render_and_ocr(page, dpi: int) -> str:
+    pix = page.get_pixmap(dpi=dpi)
+    img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+    return pytesseract.image_to_string(img)
+
+
+def _init_ocr_worker(filepath: str) -> None:
+    global _worker_doc
+    # One tesseract thread per process, the parallelism comes from the pool
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+    _worker_doc = _open_document(filepath)
+
+
+def _ocr_worker_page(page_num: int, dpi: int) -> str:
+    try:
+        return _render_and_ocr(_worker_doc[page_num], dpi)
+    except Exception as e:
+        logging.error(f"OCR failed for page {page_num}: {e}")
+        return ""
+
 
 # Concrete parser for PDF
 class PdfParser(BaseParser):
-    @staticmethod
-    def _verify_tesseract():
-        try:
-            pytesseract.get_tesseract_version()
-            return True
-        except Exception as e:
-            logging.error(f"Tesseract not properly configured: {e}")
-            return False
-
     def __init__(self):
-        if not self._verify_tesseract():
+        if not verify_tesseract():
             raise RuntimeError("Tesseract OCR is not properly installed")
         # Optionally set tesseract path
         # pytesseract.pytesseract.tesseract_cmd = (
@@ -26,52 +60,36 @@ class PdfParser(BaseParser):
 
     def parse(self, filepath: str) -> str:
         try:
-            content = []
-
-            # First try basic PDF text extraction
-            with open(filepath, "rb") as file:
-                reader = PyPDF2.PdfReader(file)
-                if reader.is_encrypted:
-                    try:
-                        reader.decrypt("")
-                    except Exception as e:
-                        logging.error(f"Failed to decrypt PDF: {e}")
-                        return "Unable to decrypt PDF"
+            try:
+                doc = _open_document(filepath)
+            except ValueError as e:
+                logging.error(f"Failed to decrypt PDF: {e}")
+                return "Unable to decrypt PDF"
 
-                for page_num in range(len(reader.pages)):
+            with doc:
+                # Single pass: keep the text layer where there is one and
+                # collect the pages that need OCR
+                content = [""] * len(doc)
+                ocr_pages = []
+                for page_num, page in enumerate(doc):
                     try:
-                        page = reader.pages[page_num]
-                        page_content = page.extract_text()
-
-                        # Clean the extracted text
-                        if page_content:
-                            page_content = page_content.replace("\x00", "")
-                            page_content = " ".join(page_content.split())
-                            content.append(page_content)
+                        content[page_num] = self._clean_text(page.get_text())
                     except Exception as e:
                         logging.error(
                             f"Error extracting text from page {page_num}: {e}"
                         )
-                        continue
+                    if len(content[page_num]) < PDF_MIN_PAGE_TEXT_CHARS:
+                        ocr_pages.append(page_num)
 
-            # If no text was extracted, try OCR
-            if not "".join(content).strip():
-                logging.info("No text extracted, attempting OCR...")
-                doc = fitz.open(filepath)
-                for page_num in range(len(doc)):
-                    try:
-                        ocr_text = self._ocr_page(filepath, page_num)
+                if ocr_pages:
+                    logging.info(f"Running OCR on {len(ocr_pages)} of {len(doc)} pages")
+                    ocr_results = self._ocr_pages(doc, filepath, ocr_pages)
+                    for page_num, ocr_text in zip(ocr_pages, ocr_results):
+                        ocr_text = self._clean_text(ocr_text)
                         if ocr_text:
-                            ocr_text = ocr_text.replace("\x00", "")
-                            ocr_text = " ".join(ocr_text.split())
-                            content.append(ocr_text)
-                    except Exception as e:
-                        logging.error(f"Error performing OCR on page {
-                                      page_num}: {e}")
-                        continue
-                doc.close()
+                            content[page_num] = ocr_text
 
-            final_content = " ".join(content)
+            final_content = " ".join(filter(None, content))
             if not final_content.strip():
                 raise ValueError("No text content extracted from PDF")
 
@@ -81,15 +99,37 @@ class PdfParser(BaseParser):
             logging.error(f"Error processing PDF: {e}")
             return f"Error processing PDF file: {str(e)}"
 
-    def _ocr_page(self, filepath: str, page_num: int) -> str:
+    def _clean_text(self, text: str) -> str:
+        """Remove NUL characters and collapse whitespace"""
+        if not text:
+            return ""
+        return " ".join(text.replace("\x00", "").split())
+
+    def _ocr_pages(self, doc, filepath: str, page_nums: list) -> list:
+        """OCR pages, in parallel across processes when there is more than one"""
+        with ocr_budget.reserve(min(PDF_OCR_WORKERS, len(page_nums))) as workers:
+            return self._ocr_pages_with(doc, filepath, page_nums, workers)
+
+    def _ocr_pages_with(self, doc, filepath: str, page_nums: list, workers: int):
+        if workers <= 1:
+            return [self._ocr_page(doc, page_num) for page_num in page_nums]
+
+        try:
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=_init_ocr_worker,
+                initargs=(filepath,),
+            ) as executor:
+                return list(
+                    executor.map(partial(_ocr_worker_page, dpi=PDF_OCR_DPI), page_nums)
+                )
+        except Exception as e:
+            logging.error(f"Parallel OCR failed, falling back to serial OCR: {e}")
+            return [self._ocr_page(doc, page_num) for page_num in page_nums]
+
+    def _ocr_page(self, doc, page_num: int) -> str:
         try:
-            doc = fitz.open(filepath)
-            page = doc[page_num]
-            pix = page.get_pixmap()
-            img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-            text = pytesseract.image_to_string(img)
-            doc.close()
-            return text
+            return _render_and_ocr(doc[page_num], PDF_OCR_DPI)
         except Exception as e:
             logging.error(f"OCR failed for page {page_num}: {e}")
             return ""
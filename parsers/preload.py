@@ -0,0 +1,9 @@
+"""Imported by the parse_pool forkserver.
+
+Creates the shared parser instances, which also checks for tesseract, once
+in the forkserver so every forked parse process starts with them ready.
+"""
+
+from file_parser import ParserFactory
+
+ParserFactory.preload()
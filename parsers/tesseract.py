@@ -0,0 +1,18 @@
+import functools
+import logging
+import pytesseract
+
+
+@functools.lru_cache(maxsize=None)
+def verify_tesseract() -> bool:
+    """Check that the tesseract binary is installed.
+
+    This runs `tesseract --version`, so the result is cached for the life of
+    the process and parsers can check it cheaply on construction.
+    """
+    try:
+        pytesseract.get_tesseract_version()
+        return True
+    except Exception as e:
+        logging.error(f"Tesseract not properly configured: {e}")
+        return False
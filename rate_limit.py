@@ -0,0 +1,116 @@
+"""Adaptive concurrency for calls to rate-limited APIs.
+
+AdaptiveLimiter bounds the requests in flight with additive increase,
+multiplicative decrease (as in TCP congestion control): the limit grows by
+one request per `limit` successful requests and is halved on a rate-limit
+response, at most once per round of requests. A Retry-After from the
+provider pauses all requests until it has passed. This keeps throughput near
+the provider's quota without piling up 429s.
+"""
+
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, Mapping, Optional
+from metrics import API_CONCURRENCY_LIMIT, API_RATE_LIMITED
+
+# Backoff in seconds after a failure without a Retry-After, doubled per retry
+RETRY_BACKOFF = 0.5
+RETRY_MAX_BACKOFF = 60.0
+
+
+def retry_after(headers: Mapping[str, str]) -> Optional[float]:
+    """Seconds to wait according to the response headers, if they say"""
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        if "retry-after" in headers:
+            return float(headers["retry-after"])
+    except ValueError:  # An HTTP date, fall back to backoff
+        pass
+    return None
+
+
+def quota_exhausted(headers: Mapping[str, str]) -> bool:
+    """Whether the provider reports no requests or tokens left in the window"""
+    return any(
+        headers.get(name) == "0"
+        for name in (
+            "x-ratelimit-remaining-requests",
+            "x-ratelimit-remaining-tokens",
+        )
+    )
+
+
+def backoff(attempt: int) -> float:
+    """Exponential backoff with jitter for the given retry (0-based)"""
+    delay = min(RETRY_MAX_BACKOFF, RETRY_BACKOFF * 2**attempt)
+    return delay * random.uniform(0.5, 1.0)
+
+
+class AdaptiveLimiter:
+    def __init__(self, api: str, maximum: int, minimum: int = 1):
+        self.api = api
+        self.maximum = maximum
+        self.minimum = minimum
+        self.limit = float(maximum)
+        self.successes = 0
+        self.rate_limited = 0
+        self._in_flight = 0
+        self._paused_until = 0.0
+        # Incremented on every decrease, so requests that were already in
+        # flight don't decrease the limit again
+        self._round = 0
+        self._condition = threading.Condition()
+        API_CONCURRENCY_LIMIT.labels(api=api).set(self.limit)
+
+    @contextmanager
+    def slot(self) -> Iterator[int]:
+        """Wait for a free slot, yields the round the request belongs to"""
+        with self._condition:
+            while True:
+                pause = self._paused_until - time.monotonic()
+                if pause > 0:
+                    self._condition.wait(pause)
+                elif self._in_flight >= int(self.limit):
+                    self._condition.wait()
+                else:
+                    break
+            self._in_flight += 1
+            request_round = self._round
+        try:
+            yield request_round
+        finally:
+            with self._condition:
+                self._in_flight -= 1
+                self._condition.notify_all()
+
+    def success(self, quota_left: bool = True) -> None:
+        """Record a success, the limit only grows while there is quota left"""
+        with self._condition:
+            self.successes += 1
+            if quota_left and self.limit < self.maximum:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+                self._condition.notify_all()
+            limit = self.limit
+        API_CONCURRENCY_LIMIT.labels(api=self.api).set(limit)
+
+    def failure(self, request_round: int, wait: float) -> None:
+        """Record a rate-limit or overload response, pausing for wait seconds"""
+        with self._condition:
+            self.rate_limited += 1
+            if request_round == self._round:
+                self.limit = max(self.minimum, self.limit / 2)
+                self._round += 1
+            self._paused_until = max(self._paused_until, time.monotonic() + wait)
+            limit = self.limit
+        API_RATE_LIMITED.labels(api=self.api).inc()
+        API_CONCURRENCY_LIMIT.labels(api=self.api).set(limit)
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "successes": self.successes,
+            "rate_limited": self.rate_limited,
+        }
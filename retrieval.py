@@ -0,0 +1,356 @@
+import base64
+import json
+import os
+from typing import List, Literal, Optional, Tuple
+from sqlalchemy import (
+    select,
+    func,
+    or_,
+    and_,
+    true,
+    cast,
+    values,
+    column,
+    Integer,
+    Select,
+    Subquery,
+)
+from pgvector.sqlalchemy import Vector
+from sqlalchemy.orm import Session
+from db import (
+    File,
+    FileChunk,
+    TEXT_SEARCH_CONFIG,
+    VECTOR_INDEX_TYPE,
+    VECTOR_STORAGE,
+    EMBEDDING_DIMENSIONS,
+    vector_distance,
+    index_distance,
+    set_search_params,
+)
+
+# Number of chunks passed to the model as context
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "10"))
+# Candidates taken from each of the lexical and vector rankings before fusion
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "50"))
+# Reciprocal rank fusion constant, larger values flatten the rank weights
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+# vector_search or hybrid_search
+RetrievalMode = Literal["vector", "hybrid"]
+
+# Upper bound for the page size of corpus-wide search
+SEARCH_MAX_TOP_K = int(os.getenv("SEARCH_MAX_TOP_K", "100"))
+# pgvector >= 0.8 iterative index scans, so that filtered searches (one
+# document, /search filters and pages) keep scanning the index until they
+# have enough rows: strict_order or relaxed_order (HNSW), relaxed_order
+# (IVFFlat), off, or auto to use them when the installed pgvector has them.
+# Without it the filter is applied to the first ef_search / probes
+# candidates of the whole corpus.
+ITERATIVE_SCAN = os.getenv("ITERATIVE_SCAN", "auto")
+# Candidates fetched from a halfvec or binary index per result, before they
+# are re-ranked with the full-precision vectors
+RERANK_FACTOR = int(
+    os.getenv("RERANK_FACTOR", "10" if VECTOR_STORAGE == "binary" else "3")
+)
+# pgvector's default and maximum hnsw.ef_search, an HNSW scan returns at
+# most ef_search rows
+HNSW_DEFAULT_EF_SEARCH = 40
+HNSW_MAX_EF_SEARCH = 1000
+
+
+def _fetch_size(limit: int) -> int:
+    """Rows read from the index to return limit results"""
+    return limit if VECTOR_STORAGE == "full" else limit * RERANK_FACTOR
+
+
+def _ef_search(ef_search: Optional[int], limit: int) -> Optional[int]:
+    """Raise ef_search, unless set explicitly, to cover the rows fetched"""
+    fetch = _fetch_size(limit)
+    if (
+        ef_search is None
+        and VECTOR_INDEX_TYPE == "hnsw"
+        and fetch > HNSW_DEFAULT_EF_SEARCH
+    ):
+        return min(fetch, HNSW_MAX_EF_SEARCH)
+    return ef_search
+
+
+def nearest_chunks(candidates: Select, embedding: list, limit: int) -> Subquery:
+    """(chunk_id, distance) of the limit chunks nearest to embedding.
+
+    candidates selects FileChunk.chunk_id with any joins and filters. With
+    VECTOR_STORAGE=halfvec or binary, RERANK_FACTOR * limit candidates are
+    read from the compact index and re-ranked by full-precision distance.
+    """
+    distance = vector_distance(FileChunk.embedding_vector, embedding)
+    if VECTOR_STORAGE == "full":
+        return (
+            candidates.add_columns(distance.label("distance"))
+            .order_by(distance)
+            .limit(limit)
+            .subquery()
+        )
+    shortlist = (
+        candidates.order_by(index_distance(FileChunk.embedding_vector, embedding))
+        .limit(_fetch_size(limit))
+        .subquery()
+    )
+    return (
+        select(FileChunk.chunk_id, distance.label("distance"))
+        .join(shortlist, FileChunk.chunk_id == shortlist.c.chunk_id)
+        .order_by(distance)
+        .limit(limit)
+        .subquery()
+    )
+
+
+def vector_search(
+    db: Session,
+    file_id: int,
+    embedding: list,
+    limit: int = RETRIEVAL_TOP_K,
+    ef_search: Optional[int] = None,
+    probes: Optional[int] = None,
+) -> List[FileChunk]:
+    set_search_params(
+        db,
+        ef_search=_ef_search(ef_search, limit),
+        probes=probes,
+        iterative_scan=ITERATIVE_SCAN,
+    )
+    nearest = nearest_chunks(
+        select(FileChunk.chunk_id).where(FileChunk.file_id == file_id),
+        embedding,
+        limit,
+    )
+    query = (
+        select(FileChunk)
+        .join(nearest, FileChunk.chunk_id == nearest.c.chunk_id)
+        .order_by(nearest.c.distance)
+    )
+    return db.scalars(query).all()
+
+
+def batch_vector_search(
+    db: Session,
+    file_id: int,
+    embeddings: List[list],
+    limit: int = RETRIEVAL_TOP_K,
+    ef_search: Optional[int] = None,
+    probes: Optional[int] = None,
+) -> List[List[FileChunk]]:
+    """vector_search for many questions in a single statement.
+
+    The question embeddings are sent as a VALUES list and each one is
+    LATERAL joined to its nearest chunks, so every question gets its own
+    index scan. Returns the chunks of each question in input order.
+    """
+    if not embeddings:
+        return []
+    set_search_params(
+        db,
+        ef_search=_ef_search(ef_search, limit),
+        probes=probes,
+        iterative_scan=ITERATIVE_SCAN,
+    )
+    questions = values(
+        column("question", Integer),
+        column("embedding", Vector(EMBEDDING_DIMENSIONS)),
+        name="questions",
+    ).data(list(enumerate(embeddings)))
+    # VALUES columns of unknown type are resolved as text by Postgres
+    embedding = cast(questions.c.embedding, Vector(EMBEDDING_DIMENSIONS))
+    shortlist = (
+        select(FileChunk.chunk_id)
+        .where(FileChunk.file_id == file_id)
+        .order_by(index_distance(FileChunk.embedding_vector, embedding))
+        .limit(_fetch_size(limit))
+        .lateral("shortlist")
+    )
+    # Re-rank by full-precision distance, a no-op for full storage
+    distance = vector_distance(FileChunk.embedding_vector, embedding)
+    ranked = (
+        select(
+            questions.c.question,
+            FileChunk.chunk_id,
+            func.row_number()
+            .over(partition_by=questions.c.question, order_by=distance)
+            .label("rank"),
+        )
+        .select_from(questions)
+        .join(shortlist, true())
+        .join(FileChunk, FileChunk.chunk_id == shortlist.c.chunk_id)
+        .subquery()
+    )
+    query = (
+        select(ranked.c.question, FileChunk)
+        .join(FileChunk, FileChunk.chunk_id == ranked.c.chunk_id)
+        .where(ranked.c.rank <= limit)
+        .order_by(ranked.c.question, ranked.c.rank)
+    )
+    results: List[List[FileChunk]] = [[] for _ in embeddings]
+    for question, chunk in db.execute(query):
+        results[question].append(chunk)
+    return results
+
+
+def hybrid_search(
+    db: Session,
+    file_id: int,
+    question: str,
+    embedding: list,
+    limit: int = RETRIEVAL_TOP_K,
+    candidates: int = HYBRID_CANDIDATES,
+    ef_search: Optional[int] = None,
+    probes: Optional[int] = None,
+) -> List[FileChunk]:
+    """Full-text and vector search merged with reciprocal rank fusion.
+
+    Both rankings are computed in a single statement: each contributes
+    1 / (RRF_K + rank) to a chunk's score.
+    """
+    set_search_params(
+        db,
+        ef_search=_ef_search(ef_search, candidates),
+        probes=probes,
+        iterative_scan=ITERATIVE_SCAN,
+    )
+
+    # Vector ranking, served by the ANN index
+    vector_top = nearest_chunks(
+        select(FileChunk.chunk_id).where(FileChunk.file_id == file_id),
+        embedding,
+        candidates,
+    )
+    vector_ranked = select(
+        vector_top.c.chunk_id,
+        func.row_number().over(order_by=vector_top.c.distance).label("rank"),
+    ).cte("vector_ranked")
+
+    # Lexical ranking, served by the GIN index on chunk_tsv
+    tsquery = func.websearch_to_tsquery(TEXT_SEARCH_CONFIG, question)
+    text_score = func.ts_rank_cd(FileChunk.chunk_tsv, tsquery)
+    text_top = (
+        select(FileChunk.chunk_id, text_score.label("score"))
+        .where(FileChunk.file_id == file_id, FileChunk.chunk_tsv.op("@@")(tsquery))
+        .order_by(text_score.desc())
+        .limit(candidates)
+        .subquery()
+    )
+    text_ranked = select(
+        text_top.c.chunk_id,
+        func.row_number().over(order_by=text_top.c.score.desc()).label("rank"),
+    ).cte("text_ranked")
+
+    rrf_score = func.coalesce(
+        1.0 / (RRF_K + vector_ranked.c.rank), 0.0
+    ) + func.coalesce(1.0 / (RRF_K + text_ranked.c.rank), 0.0)
+    fused = (
+        select(
+            func.coalesce(vector_ranked.c.chunk_id, text_ranked.c.chunk_id).label(
+                "chunk_id"
+            ),
+            rrf_score.label("score"),
+        )
+        .select_from(
+            vector_ranked.join(
+                text_ranked,
+                vector_ranked.c.chunk_id == text_ranked.c.chunk_id,
+                full=True,
+            )
+        )
+        .order_by(rrf_score.desc())
+        .limit(limit)
+        .subquery()
+    )
+    query = (
+        select(FileChunk)
+        .join(fused, FileChunk.chunk_id == fused.c.chunk_id)
+        .order_by(fused.c.score.desc())
+    )
+    return db.scalars(query).all()
+
+
+def escape_like(value: str) -> str:
+    """Escape the LIKE wildcards in value, to be matched with escape="\\" """
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def encode_cursor(distance: float, chunk_id: int) -> str:
+    payload = json.dumps([distance, chunk_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(payload).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Tuple[float, int]:
+    try:
+        distance, chunk_id = json.loads(base64.urlsafe_b64decode(cursor))
+        return float(distance), int(chunk_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def search_chunks(
+    db: Session,
+    embedding: list,
+    top_k: int = RETRIEVAL_TOP_K,
+    file_ids: Optional[List[int]] = None,
+    filename: Optional[str] = None,
+    cursor: Optional[str] = None,
+    ef_search: Optional[int] = None,
+    probes: Optional[int] = None,
+) -> Tuple[list, Optional[str]]:
+    """Corpus-wide nearest chunks with their file metadata.
+
+    Results are ordered by distance alone so the ANN index can serve the
+    query. Pages are continued with a keyset cursor on (distance, chunk_id)
+    rather than OFFSET. Returns the rows and the cursor of the next page.
+    """
+    top_k = max(1, min(top_k, SEARCH_MAX_TOP_K))
+    # Filters and cursors drop rows after the index scan, which has to carry
+    # on until the page is full
+    filtered = bool(file_ids or filename or cursor)
+    set_search_params(
+        db,
+        ef_search=_ef_search(ef_search, top_k + 1),
+        probes=probes,
+        iterative_scan=ITERATIVE_SCAN if filtered else None,
+    )
+
+    distance = vector_distance(FileChunk.embedding_vector, embedding)
+    candidates = select(FileChunk.chunk_id)
+    if file_ids:
+        candidates = candidates.where(FileChunk.file_id.in_(file_ids))
+    if filename:
+        candidates = candidates.join(File, File.file_id == FileChunk.file_id).where(
+            File.file_name.ilike(f"%{escape_like(filename)}%", escape="\\")
+        )
+    if cursor:
+        last_distance, last_chunk_id = decode_cursor(cursor)
+        candidates = candidates.where(
+            or_(
+                distance > last_distance,
+                and_(distance == last_distance, FileChunk.chunk_id > last_chunk_id),
+            )
+        )
+
+    # Fetch one extra row to know whether there is a next page
+    nearest = nearest_chunks(candidates, embedding, top_k + 1)
+    query = (
+        select(
+            FileChunk.chunk_id,
+            FileChunk.file_id,
+            FileChunk.chunk_text,
+            File.file_name,
+            nearest.c.distance,
+        )
+        .join(nearest, FileChunk.chunk_id == nearest.c.chunk_id)
+        .join(File, File.file_id == FileChunk.file_id)
+        .order_by(nearest.c.distance, FileChunk.chunk_id)
+    )
+    rows = db.execute(query).all()
+    next_cursor = None
+    if len(rows) > top_k:
+        rows = rows[:top_k]
+        next_cursor = encode_cursor(rows[-1].distance, rows[-1].chunk_id)
+    return rows, next_cursor
@@ -0,0 +1,52 @@
+import hashlib
+import os
+import tempfile
+from typing import BinaryIO, Tuple
+
+# Size of the blocks copied from the upload to disk
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+class UploadTooLargeError(Exception):
+    pass
+
+
+def save_stream(
+    source: BinaryIO,
+    directory: str,
+    extension: str,
+    max_bytes: int,
+    chunk_size: int = UPLOAD_CHUNK_SIZE,
+) -> Tuple[str, int, str]:
+    """Copy a stream to disk in fixed-size blocks, hashing it on the way.
+
+    The data is written to a uniquely named temporary file in directory and
+    only renamed into place once complete, as <SHA-256>.<extension>. Uploads
+    that share a file name therefore never read each other's bytes. Returns
+    the path, size and SHA-256 hex digest. Raises UploadTooLargeError as soon
+    as more than max_bytes have been read.
+    """
+    hasher = hashlib.sha256()
+    size = 0
+    fd, temp_location = tempfile.mkstemp(dir=directory, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as file_object:
+            while True:
+                block = source.read(chunk_size)
+                if not block:
+                    break
+                size += len(block)
+                if size > max_bytes:
+                    raise UploadTooLargeError(
+                        f"Upload exceeds the maximum size of {max_bytes} bytes"
+                    )
+                hasher.update(block)
+                file_object.write(block)
+        # Same name, same bytes: replacing a concurrent upload's file is safe
+        destination = os.path.join(directory, f"{hasher.hexdigest()}.{extension}")
+        os.replace(temp_location, destination)
+    except BaseException:
+        if os.path.exists(temp_location):
+            os.remove(temp_location)
+        raise
+    return destination, size, hasher.hexdigest()
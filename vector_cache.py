@@ -0,0 +1,186 @@
+"""In-process cache of the chunks of frequently asked documents.
+
+Once a document has been asked about VECTOR_CACHE_MIN_REQUESTS times, its
+chunk ids, texts and vectors are loaded into a contiguous float32 matrix.
+Its vector searches are then answered exactly, with one matrix product and
+argpartition, without a database round trip. Entries are tagged with the
+document's chunks_version and reloaded when it changes. The least recently
+used documents are evicted above VECTOR_CACHE_MAX_BYTES.
+
+Every API process has its own cache.
+"""
+
+import os
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+import numpy as np
+from dotenv import load_dotenv
+from sqlalchemy import select, func, LargeBinary
+from sqlalchemy.orm import Session
+from cache import LRUCache
+from db import FileChunk, VECTOR_DISTANCE, get_chunks_version
+
+load_dotenv()
+
+VECTOR_CACHE_ENABLED = os.getenv("VECTOR_CACHE_ENABLED", "false").lower() == "true"
+VECTOR_CACHE_MAX_BYTES = int(os.getenv("VECTOR_CACHE_MAX_BYTES", str(512 * 1024**2)))
+# Requests for a document before it is loaded into the cache
+VECTOR_CACHE_MIN_REQUESTS = int(os.getenv("VECTOR_CACHE_MIN_REQUESTS", "3"))
+# Documents with more chunks are left to the database
+VECTOR_CACHE_MAX_CHUNKS = int(os.getenv("VECTOR_CACHE_MAX_CHUNKS", "50000"))
+# Documents whose requests are counted, and seconds before a document that
+# couldn't be cached (too many chunks or bytes, none yet) is considered again
+_TRACKED_DOCUMENTS = 10000
+_UNCACHEABLE_TTL = 600
+
+
+class CachedChunk(NamedTuple):
+    """The FileChunk attributes used by /ask"""
+
+    chunk_id: int
+    chunk_text: str
+    embedding_vector: np.ndarray
+
+
+class CachedDocument(NamedTuple):
+    version: int
+    chunk_ids: np.ndarray
+    texts: Tuple[str, ...]
+    matrix: np.ndarray  # one float32 row per chunk
+    norms: np.ndarray  # squared row norms for l2, row norms for cosine
+
+    @property
+    def nbytes(self) -> int:
+        texts = sum(len(text) for text in self.texts)
+        return self.matrix.nbytes + self.chunk_ids.nbytes + self.norms.nbytes + texts
+
+    def distances(self, queries: np.ndarray) -> np.ndarray:
+        """Distances from every query (rows) to every chunk (columns), or
+        values ordered like them, for the configured VECTOR_DISTANCE"""
+        products = queries @ self.matrix.T
+        if VECTOR_DISTANCE == "inner_product":
+            return -products
+        if VECTOR_DISTANCE == "cosine":
+            query_norms = np.linalg.norm(queries, axis=1, keepdims=True)
+            return 1 - products / np.maximum(query_norms * self.norms, 1e-12)
+        # Squared distance, minus the query's norm which doesn't change the order
+        return self.norms - 2 * products
+
+    def search(self, embeddings: Sequence[list], limit: int) -> List[List[CachedChunk]]:
+        """Exact nearest chunks of each embedding, nearest first"""
+        queries = np.asarray(embeddings, dtype=np.float32).reshape(
+            len(embeddings), self.matrix.shape[1]
+        )
+        results = []
+        for distances in self.distances(queries):
+            if limit < len(distances):
+                nearest = np.argpartition(distances, limit)[:limit]
+            else:
+                nearest = np.arange(len(distances))
+            nearest = nearest[np.argsort(distances[nearest], kind="stable")]
+            results.append(
+                [
+                    CachedChunk(int(self.chunk_ids[i]), self.texts[i], self.matrix[i])
+                    for i in nearest
+                ]
+            )
+        return results
+
+
+def load_document(db: Session, file_id: int) -> Optional[CachedDocument]:
+    """Read a document's chunks, None if it has none or too many to cache"""
+    # Read first, so a concurrent change leaves the entry outdated rather
+    # than tagged with a version it doesn't match
+    version = get_chunks_version(db, file_id)
+    count = db.scalar(
+        select(func.count()).select_from(FileChunk).where(FileChunk.file_id == file_id)
+    )
+    if version is None or count > VECTOR_CACHE_MAX_CHUNKS:
+        return None
+    # vector_send returns pgvector's binary format, which is much cheaper
+    # to convert than lists of floats
+    rows = db.execute(
+        select(
+            FileChunk.chunk_id,
+            FileChunk.chunk_text,
+            func.vector_send(FileChunk.embedding_vector, type_=LargeBinary),
+        )
+        .where(FileChunk.file_id == file_id)
+        .order_by(FileChunk.chunk_id)
+    ).all()
+    if not rows:
+        return None
+    matrix = np.stack(
+        [np.frombuffer(vector, dtype=">f4", offset=4) for _, _, vector in rows]
+    ).astype(np.float32)
+    if VECTOR_DISTANCE == "cosine":
+        norms = np.linalg.norm(matrix, axis=1)
+    else:
+        norms = np.einsum("ij,ij->i", matrix, matrix)
+    return CachedDocument(
+        version,
+        np.fromiter((chunk_id for chunk_id, _, _ in rows), dtype=np.int64),
+        tuple(text or "" for _, text, _ in rows),
+        matrix,
+        norms,
+    )
+
+
+class VectorCache:
+    def __init__(
+        self,
+        max_bytes: int = VECTOR_CACHE_MAX_BYTES,
+        min_requests: int = VECTOR_CACHE_MIN_REQUESTS,
+    ):
+        self.min_requests = min_requests
+        self.documents = LRUCache(max_bytes, sizeof=lambda document: document.nbytes)
+        self._requests = LRUCache(_TRACKED_DOCUMENTS)
+        self._uncacheable = LRUCache(_TRACKED_DOCUMENTS, ttl=_UNCACHEABLE_TTL)
+
+    def search(
+        self,
+        db: Session,
+        file_id: int,
+        version: int,
+        embeddings: Sequence[list],
+        limit: int,
+    ) -> Optional[List[List[CachedChunk]]]:
+        """Nearest chunks of file_id for each embedding, or None if the
+        document isn't cached (yet). version is its current chunks_version."""
+        document = self.documents.get(file_id)
+        if document is not None and document.version != version:
+            # The document was hot, reload it straight away
+            document = self._load(db, file_id)
+        elif document is None and self._is_hot(file_id):
+            document = self._load(db, file_id)
+        if document is None or document.version != version:
+            return None
+        return document.search(embeddings, limit)
+
+    def _is_hot(self, file_id: int) -> bool:
+        if self._uncacheable.get(file_id):
+            return False
+        requests = self._requests.get(file_id, 0) + 1
+        if requests < self.min_requests:
+            self._requests.set(file_id, requests)
+            return False
+        self._requests.pop(file_id)
+        return True
+
+    def _load(self, db: Session, file_id: int) -> Optional[CachedDocument]:
+        document = load_document(db, file_id)
+        # The LRU cache drops values larger than all of it without a word
+        if document is None or document.nbytes > self.documents.max_size:
+            self.documents.pop(file_id)
+            self._uncacheable.set(file_id, True)
+        else:
+            self.documents.set(file_id, document)
+        return document
+
+    def clear(self) -> None:
+        self.documents.clear()
+
+    def stats(self) -> dict:
+        return {**self.documents.stats(), "bytes": self.documents.size}
+
+
+vector_cache = VectorCache()
@@ -0,0 +1,144 @@
+"""Ingestion worker pool.
+
+Drains the ingest_jobs queue with a pool of worker processes, each with its
+own database session and embeddings client.
+
+Usage:
+    python worker.py --workers 4
+"""
+
+import argparse
+import multiprocessing
+import os
+import signal
+import time
+from functools import partial
+from sqlalchemy import delete
+from sqlalchemy.orm import undefer
+from dotenv import load_dotenv
+from db import (
+    SessionLocal,
+    engine,
+    init_db,
+    bump_chunks_version,
+    File,
+    FileChunk,
+    DB_INIT_ON_STARTUP,
+)
+from embeddings import create_client
+from background_tasks import TextProcessor
+from job_queue import (
+    claim_job,
+    complete_job,
+    fail_job,
+    checkpoint_job,
+    LeaseLostError,
+)
+
+load_dotenv()
+
+# Number of worker processes, defaults to the number of cores
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(os.cpu_count() or 1)))
+# Seconds to wait before polling again when the queue is empty
+INGEST_POLL_INTERVAL = float(os.getenv("INGEST_POLL_INTERVAL", "1.0"))
+
+
+def _process_job(db, job, attempt, embedding_client):
+    file = db.get(File, job.file_id, options=[undefer(File.file_content)])
+    if file is None:
+        raise ValueError(f"File {job.file_id} no longer exists")
+
+    # Chunks are committed together with job.chunks_done, so a retry resumes
+    # after them. Jobs from before checkpoints existed start from scratch.
+    if attempt > 1 and job.chunks_done == 0:
+        db.execute(delete(FileChunk).where(FileChunk.file_id == file.file_id))
+        bump_chunks_version(db, file.file_id)
+        db.commit()
+    elif job.chunks_done:
+        print(f"Resuming job {job.job_id} after {job.chunks_done} chunks")
+
+    TextProcessor(
+        db, file.file_id, embedding_client=embedding_client, file_name=file.file_name
+    ).chunk_and_embed(
+        file.file_content,
+        start=job.chunks_done,
+        checkpoint=partial(checkpoint_job, db, job.job_id, attempt),
+    )
+
+
+def worker_main(worker_id: int, stop_event) -> None:
+    # Don't reuse connections inherited from the parent process
+    engine.dispose(close=False)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    embedding_client = create_client()
+
+    print(f"Worker {worker_id} started (pid {os.getpid()})")
+    while not stop_event.is_set():
+        db = SessionLocal()
+        try:
+            job = claim_job(db)
+            if job is None:
+                stop_event.wait(INGEST_POLL_INTERVAL)
+                continue
+
+            # Read before anything is committed, which expires the job's
+            # attributes. Every claim increments attempts, so it identifies
+            # this run of the job.
+            job_id, attempt = job.job_id, job.attempts
+            print(f"Worker {worker_id} processing job {job_id}")
+            start = time.perf_counter()
+            try:
+                _process_job(db, job, attempt, embedding_client)
+            except LeaseLostError as e:
+                # The job belongs to the worker that reclaimed it now
+                print(f"Worker {worker_id} gave up job {job_id}: {e}")
+                db.rollback()
+                continue
+            except Exception as e:
+                print(f"Worker {worker_id} job {job_id} failed: {e}")
+                db.rollback()
+                if not fail_job(db, job_id, attempt, str(e)):
+                    print(f"Worker {worker_id} job {job_id} was reclaimed")
+                continue
+
+            if not complete_job(db, job_id, attempt):
+                print(f"Worker {worker_id} job {job_id} was reclaimed")
+                continue
+            print(
+                f"Worker {worker_id} finished job {job_id} "
+                f"in {time.perf_counter() - start:.2f}s"
+            )
+        except Exception as e:
+            print(f"Worker {worker_id} error: {e}")
+            stop_event.wait(INGEST_POLL_INTERVAL)
+        finally:
+            db.close()
+    print(f"Worker {worker_id} stopped")
+
+
+def run_pool(num_workers: int) -> None:
+    if DB_INIT_ON_STARTUP:
+        init_db()
+    stop_event = multiprocessing.Event()
+
+    def _stop(signum, frame):
+        stop_event.set()
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+
+    workers = [
+        multiprocessing.Process(target=worker_main, args=(i, stop_event))
+        for i in range(num_workers)
+    ]
+    for process in workers:
+        process.start()
+    for process in workers:
+        process.join()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the ingestion worker pool")
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS)
+    args = parser.parse_args()
+    run_pool(args.workers)